@@ -5,7 +5,7 @@ Bronkhorst flow meter.
 """
 import argparse
 import logging
-from serial import Serial
+from instruments.instrument import Instrument
 from lib import helper_functions
 
 
@@ -15,54 +15,61 @@ __license__ = "MIT"
 
 logger = logging.getLogger("instrument.Bronkhorst")
 
+# ProPar ASCII messages are terminated with CR LF. Measure and setpoint
+# are signed integers where 32000 corresponds to 100 %.
+CRLF = (b"\r\n",)
+FULL_SCALE = 32000
 
-class Bronkhorst(object):
+
+class Bronkhorst(Instrument):
     """Bronkhorst flow meter
     """
 
-    def __init__(self, port):
-        """Sets an object attribute with defining the service parameters
-        """
-        super().__init__(port)
-        self._commands = ["set_rate"]
+    _readables = {
+        "measure": {"command": "get_measure"},
+        "setpoint": {"command": "get_setpoint"}
+    }
 
-    def connect(self, port="/dev/ttyUSB0", baudrate=9600, parity="N",
-                bytesize=8, stopbits=1):
-        """Connect to a serial port.
+    def __init__(self, port, node=0x80, timeout=0.5, min_interval=0.0,
+                 coalesce=False, poll_interval=None, ttl=0.0,
+                 maxsize=0, overflow="block"):
+        """Sets an object attribute with defining the service parameters
 
         Arguments
         port (str): Device port
-        baudrate (int): Baudrate
-        bytesize (int): number of bytes in packet
-        parity (str): Single character representing parity
-        stopbits (int): Stopbits
-        see https://pythonhosted.org/pyserial/pyserial_api.html#module-serial.threaded
+        node (int): ProPar node address of the instrument
+        timeout (float): Time (s) to wait for a reply to a command
+        min_interval (float): Minimum gap (s) between consecutive commands
+        coalesce (bool): Replace queued setpoint writes by newer ones
+        poll_interval (float): Period (s) to refresh the readings in the
+            background, None to only poll readings with
+            registered interest.
+        ttl (float or dict): Time (s) cached readings are served
+        maxsize (int): Maximum number of queued requests, 0 is unbounded
+        overflow (str): Policy when the queue is full (see RequestQueue)
         """
-        self._ser = Serial(port=port, baudrate=baudrate, bytesize=bytesize,
-                           parity=parity, stopbits=stopbits)
-
-    def set_serial_parameters(self, port="/dev/ttyUSB0", baudrate=9600,
-                              parity="N", bytesize=8, stopbits=1):
-        """Connect to a serial port.
+        super().__init__(port, timeout=timeout, min_interval=min_interval,
+                         coalesce=coalesce, poll_interval=poll_interval,
+                         ttl=ttl, baudrate=38400, maxsize=maxsize,
+                         overflow=overflow)
+        self._node = node
+        self._ser_params = dict(baudrate=38400, parity="N", bytesize=8,
+                                stopbits=1)
+
+    def set_serial_parameters(self, baudrate=38400, parity="N", bytesize=8,
+                              stopbits=1):
+        """Set the serial parameters used by connect.
 
         Arguments
-        port (str): Device port
         baudrate (int): Baudrate
         bytesize (int): number of bytes in packet
         parity (str): Single character representing parity
         stopbits (int): Stopbits
         see https://pythonhosted.org/pyserial/pyserial_api.html#module-serial.threaded
         """
-        self._ser_params = dict(port=port, baudrate=baudrate, parity=parity,
+        self._ser_params = dict(baudrate=baudrate, parity=parity,
                                 bytesize=bytesize, stopbits=stopbits)
 
-    def set_commands(self, commands):
-        """Set the instrument commands.
-
-        commands (dict): Keys are command names, values are formatted strings.
-        """
-        self._commands = commands
-
     @classmethod
     def from_file(cls, config_file):
         """Create the instrument object from a configuration file.
@@ -72,70 +79,79 @@ class Bronkhorst(object):
                             as yaml.
         """
         params = helper_functions.yaml_to_dict(config_file)
-        instrument = cls()
-        instrument.connect(**params["serial"])
+        serial = dict(params["serial"])
+        instrument = cls(serial.pop("port"), **params.get("instrument", {}))
+        instrument.set_serial_parameters(**serial)
+        return instrument
 
-    def _update_data(self):
-        """Periodically get the current instrument data and store
-        in class attribute to expedite responses to service requests.
-        Method is to be over-ridden.
+    def connect(self):
+        """Connect to a serial port.
         """
-        pass
+        logger.info("connecting to serial")
+        self._open_port(**self._ser_params)
+
+    def _read_parameter(self, parameter, timeout=None):
+        """Read an integer parameter of process 1.
 
-    def _process_queue(self):
-        """Pop a request off of the queue and process the request.
+        Arguments
+        parameter (int): Parameter number (0 measure, 1 setpoint)
+        timeout (float): Time (s) to wait for the reply
+
+        returns (float): Value in percent of full scale
+        """
+        reply = self._transact(
+            f":06{self._node:02X}040121012{parameter}\r\n", CRLF, timeout)
+        value = int(reply.decode("ascii").strip()[-4:], 16)
+        if value > 0x7FFF:
+            value -= 0x10000
+        return 100 * value / FULL_SCALE
+
+    def _process_request(self, command=None, timeout=None, **kwargs):
+        response = None
+        if command == "get_measure":
+            response = self._read_parameter(0, timeout)
+        elif command == "get_setpoint":
+            response = self._read_parameter(1, timeout)
+        elif command == "set_setpoint":
+            value = int(round(kwargs["setpoint"] * FULL_SCALE / 100))
+            reply = self._transact(
+                f":06{self._node:02X}010121{value & 0xFFFF:04X}\r\n", CRLF,
+                timeout)
+            # status message ":04<node>00<status><index>", status 00 is OK
+            response = reply.decode("ascii").strip()[7:9] == "00"
+        return response
+
+    def set_setpoint(self, val, callback=None):
+        """Set the setpoint (% of full scale)
+
+        Argument
+        val (float): Setpoint (%)
+
+        returns (Future): True if the instrument accepted the setpoint
         """
-        logger.info("process queue thread starting")
-        while True:
-            request = self._queue.get()
-            self._process_request(request)
-            sleep(0.3)
+        return self._queue_request(command="set_setpoint", setpoint=val,
+                                   coalesce="setpoint", callback=callback)
 
-    def _process_request(self, request):
-        """Proces the reqest. Note that the command may be blocking.
+    def get_setpoint(self, callback=None):
+        """Get the setpoint (% of full scale), from the cache if it is fresh.
 
-        Arguments
-        request (dict): Details of service request
-           command (str): Name of command to execute
-           parameters (command dependent): Parameters for command.
-           callback (fun): function to call back with command results.
+        returns (Future): Setpoint (%)
         """
-        response = False
-        command = getattr(self, request["command"], False)
-        if command:
-            # Some services (e.g. OPC) always pass arguments,
-            # so check if the method requires one.
-            if len(inspect.getfullargspec(command).args) == 1:
-                response = command()
-            else:
-                response = command(request["parameters"])
-        else:
-            try:
-                command = eval(request["command"]).encode('ascii')
-                self._serial.write(command)
-                sleep(0.3)
-                response = self._serial.readline()
-            except Exception:
-                logger.error("Error writing serial command {}".format(command))
-
-        if response:
-            request["callback"](response)
-
-    def _queue_request(self, **request):
-        """Queue requests.
+        return self._read("setpoint", callback=callback)
 
-        Arguments
-        request (dict): Details of service request
-           command (str): Name of command to execute
-           parameters (command dependent): Parameters for command.
-           callback (fun): function to call back with command results.
+    def get_measure(self, callback=None):
+        """Get the measured flow (% of full scale), from the cache if it is
+        fresh.
+
+        returns (Future): Measure (%)
         """
-        self._queue.put(request)
+        return self._read("measure", callback=callback)
 
     def main(self):
         """Start the instrument communication.
         """
-        self.connect(**self._ser_params)
+        self.connect()
+        self._start_threads()
 
 
 if __name__ == "__main__":
@@ -153,5 +169,6 @@ if __name__ == "__main__":
         default="INFO"
     )
     args = parser.parse_args()
-    instrument = Bronkhorst()
-    instrument.run(args.port)
+    instrument = Bronkhorst(args.port)
+    instrument.main()
+    print(instrument.get_measure().result(timeout=5))
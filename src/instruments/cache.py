@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Cache of instrument readings
+"""
+import threading
+import logging
+from collections import namedtuple
+from time import monotonic
+
+
+__author__ = "Brent Maranzano"
+__license__ = "MIT"
+
+
+logger = logging.getLogger("instrument.cache")
+
+
+# A value read from the instrument and the monotonic time it was read.
+Reading = namedtuple("Reading", ["value", "timestamp"])
+
+
+class Cache(object):
+    """Thread safe store of the latest instrument readings. A reading is
+    served while it is younger than the time to live of its key.
+    """
+
+    def __init__(self, ttl=0.0):
+        """Create the cache.
+
+        Arguments
+        ttl (float or dict): Time to live (s) of readings. A dictionary maps
+            keys to their time to live, keys not in it are never served.
+        """
+        self._ttl = ttl
+        self._readings = {}
+        self._lock = threading.Lock()
+
+    def _get_ttl(self, key):
+        """Get the time to live of a key.
+
+        Arguments
+        key (str): Name of the reading
+
+        returns (float): Time to live (s)
+        """
+        if isinstance(self._ttl, dict):
+            return self._ttl.get(key, 0.0)
+        return self._ttl
+
+    def update(self, key, value):
+        """Store a reading.
+
+        Arguments
+        key (str): Name of the reading
+        value (varies): Value read from the instrument
+        """
+        with self._lock:
+            self._readings[key] = Reading(value, monotonic())
+
+    def invalidate(self, key):
+        """Remove a reading (e.g. after the parameter was written).
+
+        Arguments
+        key (str): Name of the reading
+        """
+        with self._lock:
+            self._readings.pop(key, None)
+
+    def get(self, key):
+        """Get a reading if it is fresh.
+
+        Arguments
+        key (str): Name of the reading
+
+        returns (Reading): The reading or None if it is missing or expired
+        """
+        with self._lock:
+            reading = self._readings.get(key)
+        if reading is None or monotonic() - reading.timestamp > self._get_ttl(key):
+            return None
+        return reading
+
+    def snapshot(self):
+        """Get all readings regardless of age.
+
+        returns (dict): Keys are reading names, values are Readings.
+        """
+        with self._lock:
+            return dict(self._readings)
@@ -8,7 +8,8 @@ import logging
 from random import random
 from serial import Serial
 from time import sleep
-from instruments.instrument import Instrument
+from services.serial import Instrument
+from instruments.transport import SerialTransport
 
 __author__ = "Brent Maranzano"
 __license__ = "MIT"
@@ -42,13 +43,8 @@ class Generic(Instrument):
         """
         logger.info("connecting to serial")
         self._serial = Serial(**self._params["serial"])
-
-    def _update_data(self):
-        """Update the instrument data
-        TODO
-        """
-        logger.info("starting thread to update data")
-        return
+        self._transport = SerialTransport(
+            self._serial, **self._params.get("transaction", {}))
 
     def main(self):
         """Entry point
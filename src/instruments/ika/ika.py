@@ -5,8 +5,8 @@ IKA overhead stirrer.
 """
 import argparse
 import logging
-from serial import Serial
 from instruments.instrument import Instrument
+from instruments.request_queue import CRITICAL
 from lib import helper_functions
 
 
@@ -16,18 +16,37 @@ __license__ = "MIT"
 
 logger = logging.getLogger("instrument.Bronkhorst")
 
+# Replies to IN_ commands are terminated with CR LF, OUT_ and START/STOP
+# commands are not answered.
+CRLF = (b"\r\n",)
+
 
 class Ika(Instrument):
     """Ika overhead stirrer interface.
     """
 
-    def __init__(self, port):
+    _readables = {
+        "rate_SP": {"command": "IN_SP_4 \r \n", "terminators": CRLF},
+        "rate_PV": {"command": "IN_PV_4 \r \n", "terminators": CRLF}
+    }
+
+    def __init__(self, port, coalesce=False, poll_interval=None, ttl=0.0,
+                 maxsize=0, overflow="block"):
         """Sets an object attribute with defining the device port.
 
         Arguments
         port (str): Device port
+        coalesce (bool): Replace queued set point writes by newer ones
+        poll_interval (float): Period (s) to refresh the readings in the
+            background, None to only poll readings with
+            registered interest.
+        ttl (float or dict): Time (s) cached readings are served
+        maxsize (int): Maximum number of queued requests, 0 is unbounded
+        overflow (str): Policy when the queue is full (see RequestQueue)
         """
-        super().__init__(port)
+        super().__init__(port, coalesce=coalesce,
+                         poll_interval=poll_interval, ttl=ttl,
+                         maxsize=maxsize, overflow=overflow)
 
     def connect(self):
         """Connect to a serial port.
@@ -35,44 +54,63 @@ class Ika(Instrument):
         Arguments
         port (str): Device port
         """
-        self._ser = Serial(port=self._port, baudrate=9600, bytesize=7,
-                           parity="E", stopbits=1, rtscts=0, timeout=0.5)
+        self._open_port(baudrate=9600, bytesize=7, parity="E", stopbits=1,
+                        rtscts=0)
+
+    def _process_request(self, command=None, terminators=None, **kwargs):
+        """Write the command and parse the value of replies (e.g.
+        "123.4 4" to IN_PV_4).
+
+        returns (float): Value replied, None for commands without reply
+        """
+        reply = super()._process_request(command=command,
+                                         terminators=terminators, **kwargs)
+        if reply is None:
+            return None
+        return float(reply.decode("ascii").split()[0])
 
     def start(self, callback=None):
         """Start stirrer.
         """
         command = "START_4 \r \n"
-        self._queue_request(command=command, callback=callback)
+        return self._queue_request(command=command, callback=callback)
 
     def stop(self, callback=None):
-        """Stop stirrer.
+        """Stop stirrer, served ahead of routine commands. Pending commands
+        (start, set points) are cancelled, so they cannot restart it.
         """
         command = "STOP_4 \r \n"
-        self._queue_request(command=command, callback=callback)
+        return self._queue_request(command=command, priority=CRITICAL,
+                                   callback=callback)
 
     def set_rate(self, rate, callback=None):
         """Set the stir rate (rev/min)
         """
         command = "OUT_SP_4 {:.2f} \r \n".format(rate)
-        self._queue_request(command=command, callback=callback)
+        return self._queue_request(command=command, coalesce="rate_SP",
+                                   callback=callback)
 
     def get_rate_SP(self, callback=None):
-        """Get the stir rate set point (rev/min)
+        """Get the stir rate set point (rev/min), from the cache if it is
+        fresh.
+
+        returns (Future): Stir rate set point (rev/min)
         """
-        command = "IN_SP_4 \r \n"
-        self._queue_request(command=command, callback=callback)
+        return self._read("rate_SP", callback=callback)
 
     def get_rate_PV(self, callback=None):
-        """Get the stir rate present value (rev/min)
+        """Get the stir rate present value (rev/min), from the cache if it
+        is fresh.
+
+        returns (Future): Stir rate present value (rev/min)
         """
-        command = "IN_PV_4 \r \n"
-        self._queue_request(command=command, callback=callback)
+        return self._read("rate_PV", callback=callback)
 
     def main(self):
         """Start the instrument communication.
         """
-        super()._start_threads()
         self.connect()
+        super()._start_threads()
 
 
 if __name__ == "__main__":
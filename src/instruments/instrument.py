@@ -6,7 +6,12 @@ Abstract serial instrument
 import queue
 import threading
 import logging
-from time import sleep
+from concurrent.futures import Future
+from functools import partial
+from instruments.cache import Cache
+from instruments.poll_scheduler import PollScheduler
+from instruments.request_queue import BACKGROUND, RequestQueue
+from instruments.transport import close_transport, open_transport
 
 
 __author__ = "Brent Maranzano"
@@ -19,17 +24,61 @@ logger = logging.getLogger("instrument")
 class Instrument(object):
     """Abstract serial instrument that provides state retention, user
     authentification and asynchronous communication.
+
+    Inheriting classes list their readable values in _readables, a map
+    between the name of the reading and the request that reads it. Readings
+    are cached, refreshed in the background for the consumers that
+    registered interest in them (see register_interest), and served from the
+    cache while they are fresh (see _read).
     """
 
-    def __init__(self, port):
+    _readables = {}
+
+    def __init__(self, port, timeout=0.5, min_interval=0.0, coalesce=False,
+                 poll_interval=None, ttl=0.0, baudrate=9600, maxsize=0,
+                 overflow="block"):
         """Sets an object attribute with defining the service parameters
 
         Arguments
         port (str): The device port
-        callback (func): The function to call after command execution.
+        timeout (float): Time (s) to wait for a reply to a command
+        min_interval (float): Minimum gap (s) between consecutive commands
+        coalesce (bool): Replace queued set point writes by newer writes to
+            the same parameter (see RequestQueue)
+        poll_interval (float): Period (s) to refresh all readings in the
+            background, None to only poll readings with registered interest.
+        ttl (float or dict): Time to live (s) of cached readings (see Cache)
+        baudrate (int): Baudrate of the link, sets the polling budget
+        maxsize (int): Maximum number of queued requests, 0 is unbounded
+        overflow (str): Policy when the queue is full, "block" the caller,
+            "reject" the request or "drop_oldest" (see RequestQueue)
         """
         self._port = port
-        self._queue = queue.Queue()
+        self._timeout = timeout
+        self._min_interval = min_interval
+        self._queue = RequestQueue(maxsize=maxsize, coalesce=coalesce,
+                                   overflow=overflow)
+        self._cache = Cache(ttl)
+        # reads being processed, map between the cache key and the futures
+        # of requests attached while in flight (see _queue_request)
+        self._inflight = {}
+        # keys of the reads in flight later reads may attach to, a write
+        # queued after the read started closes its key
+        self._inflight_open = set()
+        # writes (their coalesce key, None for ordered commands) being put
+        # in the queue, barriers to the reads starting meanwhile
+        self._queuing = []
+        self._inflight_lock = threading.Lock()
+        self._collapsed = 0
+        self._polls = PollScheduler(baudrate=baudrate)
+        if poll_interval is not None:
+            for key in self._readables:
+                self._polls.register(key, "poll_interval", poll_interval,
+                                     poll_interval)
+        self._transport = None
+        # object that serves the queue in place of the instrument thread
+        # (e.g. a bus shared by several instruments), see _queue_request
+        self._scheduler = None
 
     def connect(self, port):
         """Connect to a serial port. Method to be overridden
@@ -39,13 +88,130 @@ class Instrument(object):
         """
         pass
 
+    def _open_port(self, **serial_params):
+        """Open the port of the instrument: a pooled TCP connection if the
+        port is "tcp://host:port" (LAN attached device or serial device
+        server), otherwise a serial port.
+
+        Arguments
+        serial_params: Parameters of the serial port (e.g. baudrate)
+        """
+        self._transport = open_transport(self._port, self._timeout,
+                                         self._min_interval, **serial_params)
+
+    def close(self):
+        """Close the port of the instrument. A pooled TCP connection stays
+        open for the other instruments using it, the port of an instrument
+        served by a scheduler (e.g. a bus) is closed by its owner.
+        """
+        transport, self._transport = self._transport, None
+        if transport is not None and self._scheduler is None:
+            close_transport(self._port, transport)
+
+    def _transact(self, command, terminators=None, timeout=None):
+        """Write a command and read the reply until a terminator arrives.
+
+        Arguments
+        command (str or bytes): Command frame
+        terminators (tuple): Byte strings that end the reply, None if the
+            device does not reply.
+        timeout (float): Time (s) to wait for the reply
+
+        returns (bytes): Reply or None
+        """
+        if isinstance(command, str):
+            command = command.encode("ascii")
+        return self._transport.transact(command, terminators, timeout)
+
+    def _process_request(self, command=None, terminators=None, timeout=None,
+                         **kwargs):
+        """Write a raw command frame and return the reply. Method to be
+        overridden by instruments with named commands.
+
+        Arguments
+        command (str or bytes): Command frame
+        terminators (tuple): Byte strings that end the reply
+        timeout (float): Time (s) to wait for the reply
+
+        returns (bytes): Reply or None
+        """
+        return self._transact(command, terminators, timeout)
+
+    def _execute(self, request):
+        """Process a request and resolve its future, and the futures of the
+        requests it replaced or collapsed with. Requests cancelled while they
+        were queued are skipped.
+
+        Arguments
+        request (dict): Request as queued by _queue_request
+        """
+        request = dict(request)
+        for key in ("priority", "queued"):
+            request.pop(key, None)
+        written = request.pop("coalesce", None)
+        read = request.pop("cache", None)
+        waiters = [(request.pop("future"), request.pop("callback", None))]
+        waiters += request.pop("followers", [])
+        waiters = [(f, c) for f, c in waiters
+                   if f.set_running_or_notify_cancel()]
+        if not waiters:
+            return
+        if read is not None:
+            with self._inflight_lock:
+                self._inflight[read] = []
+                queuing = any(k is None or k == read for k in self._queuing)
+                if not (queuing or self._queue.has_barrier(read)):
+                    self._inflight_open.add(read)
+        try:
+            response = self._process_request(**request)
+        except Exception as error:
+            logger.error(f"{request.get('command')!r} failed: {error}")
+            for future, _ in waiters + self._land(read):
+                future.set_exception(error)
+            return
+        if written is not None:
+            self._cache.invalidate(written)
+        if read is not None:
+            self._cache.update(read, response)
+        waiters += self._land(read)
+        for future, _ in waiters:
+            future.set_result(response)
+        # callbacks run once all futures are resolved, a failing callback
+        # must not stall the other waiters or the worker thread
+        for _, callback in waiters:
+            if callback is not None:
+                try:
+                    callback(response)
+                except Exception:
+                    logger.exception(f"callback of {request.get('command')!r}"
+                                     " failed")
+
+    def _land(self, read):
+        """Take the requests attached to a read while it was in flight.
+
+        Arguments
+        read (str): Cache key of the read, None if the request is no read
+
+        returns (list): (future, callback) of the attached requests
+        """
+        if read is None:
+            return []
+        with self._inflight_lock:
+            waiters = self._inflight.pop(read)
+            self._inflight_open.discard(read)
+        return [(f, c) for f, c in waiters
+                if f.set_running_or_notify_cancel()]
+
     def _process_queue(self):
         """Pop a request off of the queue and process the request.
         """
         logger.info("process queue thread starting")
         while True:
             request = self._queue.get()
-            self._process_request(**request)
+            try:
+                self._execute(request)
+            except Exception:
+                logger.exception(f"{request.get('command')!r} failed")
 
     def _queue_request(self, **request):
         """Queue requests.
@@ -54,10 +220,153 @@ class Instrument(object):
         request (dict): Details of service request
            command (str): Name of command to execute
            callback (fun): function to call back with command results.
+           timeout (float): Time (s) to wait for the instrument reply
+           coalesce (str): Name of the parameter written by the request,
+               pending writes to the same parameter may be replaced.
+           priority (int): Queue lane, CRITICAL requests are served
+               ahead of NORMAL ones, a CRITICAL command cancels the
+               commands pending in the other lanes (see RequestQueue).
+           cache (str): Name of the reading returned by the request, the
+               result is stored in the cache. Identical reads queued or in
+               flight are collapsed into one instrument transaction.
+
+        returns (Future): Resolves to the command result. A request whose
+            future is cancelled before it is processed is skipped when it
+            leaves the queue (it keeps its place until then and counts
+            against maxsize).
+            The future fails with queue.Full if the request is rejected or
+            dropped by a full queue.
+        """
+        future = Future()
+        request["future"] = future
+        read = request.get("cache")
+        written = request.get("coalesce")
+        with self._inflight_lock:
+            if read is None:
+                # a write (or an ordered command) must be seen by later
+                # reads, they do not attach to the reads in flight
+                if written is None:
+                    self._inflight_open.clear()
+                else:
+                    self._inflight_open.discard(written)
+                self._queuing.append(written)
+            elif read in self._inflight_open:
+                self._inflight[read].append(
+                    (future, request.get("callback")))
+                self._collapsed += 1
+                return future
+        try:
+            self._queue.put(request)
+        except queue.Full as error:
+            logger.warning(f"{request.get('command')!r} rejected: {error}")
+            future.set_exception(error)
+            return future
+        finally:
+            if read is None:
+                with self._inflight_lock:
+                    self._queuing.remove(written)
+        if self._scheduler is not None:
+            self._scheduler.notify()
+        return future
+
+    def _read(self, key, callback=None):
+        """Get a reading, from the cache if it is fresh, otherwise from the
+        instrument.
+
+        Arguments
+        key (str): Name of the reading (see _readables)
+        callback (fun): function to call back with the reading.
+
+        returns (Future): Resolves to the reading
+        """
+        reading = self._cache.get(key)
+        if reading is None:
+            return self._queue_request(cache=key, callback=callback,
+                                       **self._readables[key])
+        future = Future()
+        future.set_result(reading.value)
+        if callback is not None:
+            callback(reading.value)
+        return future
+
+    def snapshot(self):
+        """Get the latest readings regardless of age.
+
+        returns (dict): Keys are reading names, values are Readings
+            (value, timestamp).
+        """
+        return self._cache.snapshot()
+
+    def register_interest(self, key, consumer, min_interval=0.5,
+                          max_interval=10.0, tolerance=0.0):
+        """Register interest of a consumer in a reading, the reading is
+        polled in the background while it has consumers.
+
+        Arguments
+        key (str): Name of the reading (see _readables)
+        consumer (hashable): Identifier of the consumer (e.g. OPC node name)
+        min_interval (float): Shortest poll interval (s), used while the
+            value changes
+        max_interval (float): Longest poll interval (s), used while the
+            value is stable
+        tolerance (float): Change of the value considered as stable
+        """
+        self._polls.register(key, consumer, min_interval, max_interval,
+                             tolerance)
+
+    def release_interest(self, key, consumer):
+        """Release the interest of a consumer in a reading.
+
+        Arguments
+        key (str): Name of the reading
+        consumer (hashable): Identifier of the consumer
+        """
+        self._polls.release(key, consumer)
+
+    def poll_stats(self):
+        """Get the polling statistics.
+
+        returns (dict): see PollScheduler.stats
+        """
+        return self._polls.stats()
+
+    def _update_data(self):
+        """Poll the readings consumers are interested in and store them in
+        the cache to expedite responses to service requests. Polls are queued
+        in the BACKGROUND lane, so they do not delay control commands.
+        """
+        logger.info("starting thread to update data")
+        while True:
+            for key in self._polls.wait_due():
+                future = self._queue_request(cache=key, priority=BACKGROUND,
+                                             **self._readables[key])
+                future.add_done_callback(partial(self._polled, key))
+
+    def _polled(self, key, future):
+        """Report the result of a poll to the scheduler.
+
+        Arguments
+        key (str): Name of the reading
+        future (Future): Future of the poll request
+        """
+        if future.cancelled() or future.exception() is not None:
+            self._polls.update(key, None)
+        else:
+            self._polls.update(key, future.result())
+
+    def queue_stats(self):
+        """Get the request queue statistics.
+
+        returns (dict): see RequestQueue.stats, collapsed includes reads
+            attached to a read in flight.
         """
-        self._queue.put(request)
+        stats = self._queue.stats()
+        stats["collapsed"] += self._collapsed
+        return stats
 
     def _start_threads(self):
         """Setup the instrument communication.
         """
         threading.Thread(target=self._process_queue, daemon=True).start()
+        if self._readables:
+            threading.Thread(target=self._update_data, daemon=True).start()
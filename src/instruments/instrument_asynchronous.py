@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Abstract asyncio serial instrument
+"""
+import asyncio
+import logging
+import serial_asyncio
+
+
+__author__ = "Brent Maranzano"
+__license__ = "MIT"
+
+
+logger = logging.getLogger("instrument")
+
+
+class AsyncInstrument(object):
+    """Abstract serial instrument driven by an asyncio event loop. Serial I/O
+    is performed with serial_asyncio streams, so a single loop can drive many
+    instruments without a thread per port. Commands to one instrument are
+    serialized, commands to different instruments run concurrently.
+    """
+
+    def __init__(self, port, timeout=0.5, min_interval=0.0, poll=0.05):
+        """Sets an object attribute with defining the device port.
+
+        Arguments
+        port (str): The device port
+        timeout (float): Time (s) to wait for a reply to a command
+        min_interval (float): Minimum gap (s) between consecutive commands
+        poll (float): Quiet time (s) used to flush late replies after a
+            timeout or a cancellation
+        """
+        self._port = port
+        self._timeout = timeout
+        self._min_interval = min_interval
+        self._poll = poll
+        self._reader = None
+        self._writer = None
+        self._lock = None
+        self._buffer = b""
+        # (terminators, deadline) of a reply abandoned before it arrived
+        self._pending = None
+        self._last = 0.0
+
+    async def connect(self):
+        """Connect to the instrument. Method to be overridden.
+        """
+        pass
+
+    async def _open(self, **serial_params):
+        """Open the serial streams.
+
+        Arguments
+        serial_params (dict): Parameters passed to serial.Serial
+            (e.g. baudrate, bytesize, parity, stopbits)
+        """
+        logger.info(f"opening {self._port}")
+        self._reader, self._writer = await serial_asyncio.open_serial_connection(
+            url=self._port, **serial_params)
+        self._lock = asyncio.Lock()
+
+    async def close(self):
+        """Close the serial streams.
+        """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def _transact(self, command, terminators=None, timeout=None):
+        """Write a command and read the reply until a terminator arrives.
+
+        Arguments
+        command (str or bytes): Command frame
+        terminators (tuple): Byte strings that end the reply, None if the
+            device does not reply.
+        timeout (float): Time (s) to wait for the reply
+
+        returns (bytes): Reply up to and including the first terminator,
+            or None
+        """
+        if isinstance(command, str):
+            command = command.encode("ascii")
+        timeout = self._timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            wait = self._min_interval - (loop.time() - self._last)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                if self._pending is not None:
+                    await self._flush()
+                self._buffer = b""
+                # pending until the reply is read, so a reply arriving after a
+                # timeout or a cancellation is discarded by the next command
+                self._pending = (terminators, loop.time() + timeout)
+                self._writer.write(command)
+                await self._writer.drain()
+                if terminators is None:
+                    self._pending = None
+                    return None
+                try:
+                    reply = await asyncio.wait_for(
+                        self._read_until(terminators), timeout)
+                except asyncio.TimeoutError:
+                    logger.warning(f"timeout waiting for reply to {command!r}, "
+                                   f"received {self._buffer!r}")
+                    raise TimeoutError(
+                        f"no reply to {command!r} within {timeout} s")
+                self._pending = None
+                return reply
+            finally:
+                self._last = loop.time()
+
+    async def _read_until(self, terminators):
+        """Read from the stream until the reply contains a terminator.
+        Line feeds left over from the previous reply are skipped.
+
+        Arguments
+        terminators (tuple): Byte strings that end a reply
+
+        returns (bytes): Reply up to and including the first terminator
+        """
+        while True:
+            data = await self._reader.read(1024)
+            if not data:
+                raise ConnectionError("connection closed by the device")
+            self._buffer = (self._buffer + data).lstrip(b"\r\n")
+            ends = [self._buffer.find(t) + len(t) for t in terminators
+                    if t in self._buffer]
+            if ends:
+                return self._buffer[:min(ends)]
+
+    async def _flush(self):
+        """Discard the reply of an abandoned command: wait for it until the
+        command would have timed out, then discard bytes until the line has
+        been quiet for the poll time or the stream has ended.
+        """
+        terminators, deadline = self._pending
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.wait_for(self._read_until(terminators),
+                                   max(0.0, deadline - loop.time()))
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        try:
+            while await asyncio.wait_for(self._reader.read(1024),
+                                         self._poll):
+                pass
+        except asyncio.TimeoutError:
+            pass
+        self._pending = None
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Several Ismatec pumps daisy chained on one serial line.
+"""
+import argparse
+import logging
+import queue
+import threading
+from instruments.ismatec.ismatec import Ismatec
+from instruments.transport import close_transport, open_transport
+
+__author__ = "Brent Maranzano"
+__license__ = "MIT"
+
+
+logger = logging.getLogger("instrument.ismatec.bus")
+
+
+class IsmatecBus(object):
+    """Owns the serial port of a multi-drop line and serves per-address
+    Ismatec pumps. Each pump keeps its own request queue, a single bus thread
+    takes one request per address in turn, so a busy pump cannot starve the
+    others. CRITICAL requests of any pump are served ahead of the other
+    requests of all pumps. The readings of the pumps are polled in the
+    background (see Instrument.register_interest) by a poller thread per
+    pump, the polls are served by the bus thread like the other requests.
+    """
+
+    def __init__(self, port, timeout=0.5, min_interval=0.0, coalesce=False,
+                 maxsize=0, overflow="block", poll_interval=None, ttl=0.0):
+        """Sets an object attribute with defining the device port.
+
+        Arguments
+        port (str): Device port
+        timeout (float): Time (s) to wait for a reply to a command
+        min_interval (float): Minimum gap (s) between consecutive commands
+            on the line
+        coalesce (bool): Replace queued flowrate writes by newer ones
+        maxsize (int): Maximum number of queued requests per pump
+        overflow (str): Policy when a pump queue is full (see RequestQueue)
+        poll_interval (float): Default period (s) to refresh the flowrate of
+            the pumps in the background, None to only poll readings with
+            registered interest.
+        ttl (float): Default time (s) a cached flowrate is served
+        """
+        self._port = port
+        self._timeout = timeout
+        self._min_interval = min_interval
+        self._pump_options = dict(coalesce=coalesce, maxsize=maxsize,
+                                  overflow=overflow,
+                                  poll_interval=poll_interval, ttl=ttl)
+        self._transport = None
+        self._pumps = {}  # map between address and Ismatec
+        self._lock = threading.Lock()
+        self._pending = threading.Event()
+        self._next = 0
+        self._started = False
+
+    def pump(self, address, **options):
+        """Get the pump at an address, the pump is created on first use.
+
+        Arguments
+        address (int): Pump address (1-8)
+        options: Options of the pump overriding the bus defaults when it is
+            created (coalesce, maxsize, overflow, poll_interval, ttl)
+
+        returns (Ismatec): Pump whose requests are served by the bus
+        """
+        with self._lock:
+            if address in self._pumps:
+                return self._pumps[address]
+            pump = Ismatec(self._port, address=address, timeout=self._timeout,
+                           **dict(self._pump_options, **options))
+            pump._scheduler = self
+            pump._transport = self._transport
+            self._pumps[address] = pump
+            started = self._started
+        if self._transport is not None:
+            pump._initialize()
+        if started:
+            self._start_poller(pump)
+        return pump
+
+    def _start_poller(self, pump):
+        """Start polling the readings of a pump.
+
+        Arguments
+        pump (Ismatec): Pump
+        """
+        threading.Thread(target=pump._update_data, daemon=True).start()
+
+    def connect(self):
+        """Open the serial port (or the TCP connection to a serial device
+        server if the port is "tcp://host:port") and initialize the pumps on
+        the line.
+        """
+        logger.info("connecting to serial")
+        self._transport = open_transport(
+            self._port, self._timeout, self._min_interval, baudrate=9600,
+            bytesize=8, parity="N", stopbits=1)
+        with self._lock:
+            pumps = list(self._pumps.values())
+        for pump in pumps:
+            pump._transport = self._transport
+            pump._initialize()
+
+    def close(self):
+        """Close the port of the line, the pumps can no longer be served.
+        """
+        with self._lock:
+            pumps = list(self._pumps.values())
+        for pump in pumps:
+            pump._transport = None
+        transport, self._transport = self._transport, None
+        if transport is not None:
+            close_transport(self._port, transport)
+
+    def queue_depths(self):
+        """Get the number of queued requests of every pump.
+
+        returns (dict): Keys are addresses, values are queue depths.
+        """
+        with self._lock:
+            return {a: p._queue.qsize() for a, p in self._pumps.items()}
+
+    def notify(self):
+        """Wake the bus thread, called when a pump queues a request.
+        """
+        self._pending.set()
+
+    def _next_request(self):
+        """Take the next request in round robin order of the addresses, the
+        CRITICAL lanes of all pumps are scanned first.
+
+        returns (tuple): (Ismatec, request) or None if all queues are empty
+        """
+        with self._lock:
+            pumps = [self._pumps[a] for a in sorted(self._pumps)]
+        for get in ("get_critical", "get_nowait"):
+            for i in range(len(pumps)):
+                pump = pumps[(self._next + i) % len(pumps)]
+                try:
+                    request = getattr(pump._queue, get)()
+                except queue.Empty:
+                    continue
+                self._next = (self._next + i + 1) % len(pumps)
+                return pump, request
+        return None
+
+    def _process_queue(self):
+        """Serve the pump queues.
+        """
+        logger.info("bus thread starting")
+        while True:
+            # clear before scanning so a request queued during the scan
+            # wakes the following wait
+            self._pending.clear()
+            item = self._next_request()
+            if item is None:
+                self._pending.wait()
+                continue
+            pump, request = item
+            try:
+                pump._execute(request)
+            except Exception:
+                logger.exception(f"{request.get('command')!r} failed")
+
+    def main(self):
+        """Entry point
+        """
+        self.connect()
+        threading.Thread(target=self._process_queue, daemon=True).start()
+        with self._lock:
+            self._started = True
+            pumps = list(self._pumps.values())
+        for pump in pumps:
+            self._start_poller(pump)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Service to call Ismatec pumps on one serial line."
+    )
+    parser.add_argument(
+        "--port",
+        help="Device port instrument is connected",
+        type=str,
+        default="/dev/ttyUSB0"
+    )
+    parser.add_argument(
+        "--addresses",
+        help="Pump addresses on the line",
+        type=int,
+        nargs="+",
+        default=[1, 2]
+    )
+    parser.add_argument(
+        "--debug_level",
+        help="debugger level (e.g. INFO, WARN, DEBUG, ...)",
+        type=str,
+        default="INFO"
+    )
+    args = parser.parse_args()
+    bus = IsmatecBus(args.port)
+    pumps = [bus.pump(address) for address in args.addresses]
+    bus.main()
+    print([pump.get_flowrate().result(timeout=5) for pump in pumps])
+    print(bus.queue_depths())
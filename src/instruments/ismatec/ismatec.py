@@ -5,8 +5,8 @@ Ismatec pump control
 """
 import argparse
 import logging
-from serial import Serial
 from instruments.instrument import Instrument
+from instruments.request_queue import CRITICAL
 from pdb import set_trace
 from time import sleep
 
@@ -16,18 +16,40 @@ __license__ = "MIT"
 
 logger = logging.getLogger("instrument.ismatec")
 
+# The pump acknowledges commands with "*" (or "#" if not executed) and
+# terminates query replies with a carriage return.
+ACK = (b"*", b"#")
+CR = (b"\r",)
+
 
 class Ismatec(Instrument):
     """Ismatec pump controller.
     """
 
-    def __init__(self, port):
+    _readables = {"flowrate": {"command": "get_flowrate"}}
+
+    def __init__(self, port, address=1, timeout=0.5, min_interval=0.0,
+                 coalesce=False, poll_interval=None, ttl=0.0,
+                 maxsize=0, overflow="block"):
         """Sets an object attribute with defining the device port.
 
         Arguments
         port (str): Device port
+        address (int): Pump address (1-8) on the serial line
+        timeout (float): Time (s) to wait for a reply to a command
+        min_interval (float): Minimum gap (s) between consecutive commands
+        coalesce (bool): Replace queued flowrate writes by newer ones
+        poll_interval (float): Period (s) to refresh the flowrate in the
+            background, None to only poll readings with
+            registered interest.
+        ttl (float): Time (s) a cached flowrate is served
+        maxsize (int): Maximum number of queued requests, 0 is unbounded
+        overflow (str): Policy when the queue is full (see RequestQueue)
         """
-        super().__init__(port)
+        super().__init__(port, timeout=timeout, min_interval=min_interval,
+                         coalesce=coalesce, poll_interval=poll_interval,
+                         ttl=ttl, maxsize=maxsize, overflow=overflow)
+        self._address = address
 
     def connect(self):
         """Connect to the serial instrument
@@ -36,52 +58,66 @@ class Ismatec(Instrument):
         params (dict): Parameters to start instrument
         """
         logger.info("connecting to serial")
-        self._ser = Serial(port=self._port, baudrate=9600, bytesize=8,
-                           parity="N", stopbits=1, timeout=0.5)
-        self._ser.write(f"@1{chr(13)}".encode('ascii'))
-        self._ser.write(f"1M{chr(13)}".encode('ascii'))
+        self._open_port(baudrate=9600, bytesize=8, parity="N", stopbits=1)
+        self._transact(f"@{self._address}{chr(13)}", ACK)
+        self._initialize()
+
+    def _initialize(self):
+        """Put the pump in RPM mode.
+        """
+        self._transact(f"{self._address}M{chr(13)}", ACK)
 
-    def _process_request(self, command=None, callback=None, **kwargs):
-        response = True
+    def _process_request(self, command=None, timeout=None, **kwargs):
+        response = None
+        address = self._address
         if command == "start":
-            self._ser.write(f"1H{chr(13)}".encode('ascii'))
+            response = self._transact(f"{address}H{chr(13)}", ACK,
+                                      timeout) == b"*"
         elif command == "stop":
-            self._ser.write(f"1I{chr(13)}".encode('ascii'))
+            response = self._transact(f"{address}I{chr(13)}", ACK,
+                                      timeout) == b"*"
         elif command == "set_flowrate":
             flowrate = str(int(kwargs["flowrate"])).zfill(5)
-            string = f"1S{flowrate}{chr(13)}"
-            self._ser.write(string.encode('ascii'))
+            response = self._transact(f"{address}S{flowrate}{chr(13)}", ACK,
+                                      timeout) == b"*"
         elif command == "get_flowrate":
-            self._ser.write(f"1S{chr(13)}".encode('ascii'))
-            sleep(0.3)
-            response = float(self._ser.readline().decode().split("\r")[0].strip("*"))
-        if callback is not None:
-            callback(response)
-        sleep(0.3)
+            reply = self._transact(f"{address}S{chr(13)}", CR, timeout)
+            response = float(reply.decode().strip().strip("*"))
+        return response
 
     def start(self, callback=None):
         """Start the pump.
+
+        returns (Future): True if the pump acknowledged the command
         """
-        self._queue_request(command="start", callback=callback)
+        return self._queue_request(command="start", callback=callback)
 
     def stop(self, callback=None):
-        """Stop the pump.
+        """Stop the pump, served ahead of routine commands. Pending commands
+        (start, set points) are cancelled, so they cannot restart the pump.
+
+        returns (Future): True if the pump acknowledged the command
         """
-        self._queue_request(command="stop", callback=callback)
+        return self._queue_request(command="stop", priority=CRITICAL,
+                                   callback=callback)
 
     def set_flowrate(self, val, callback=None):
         """Set the pump rpm (1/min)
 
         Argument
         val (float): Pump RPMs (1/min)
+
+        returns (Future): True if the pump acknowledged the command
         """
-        self._queue_request(command="set_flowrate", flowrate=val,
-                            callback=callback)
+        return self._queue_request(command="set_flowrate", flowrate=val,
+                                   coalesce="flowrate", callback=callback)
 
     def get_flowrate(self, callback=None):
-        """Get the pump rpm (1/min)
+        """Get the pump rpm (1/min), from the cache if it is fresh.
+
+        returns (Future): Pump RPMs (1/min)
         """
-        self._queue_request(command="get_flowrate", callback=callback)
+        return self._read("flowrate", callback=callback)
 
     def main(self):
         """Entry point
@@ -111,11 +147,6 @@ if __name__ == "__main__":
     instrument.main()
     instrument.set_flowrate(555)
     instrument.start()
-    instrument.get_flowrate(callback=print)
+    print(instrument.get_flowrate().result(timeout=5))
     sleep(2)
-    instrument.stop()
-    try:
-        while instrument._queue.empty() is False:
-            pass
-    except KeyboardInterrupt:
-        pass
+    instrument.stop().result(timeout=5)
@@ -6,9 +6,8 @@ Ismatec pump control
 import argparse
 import logging
 import asyncio
-import serial_asyncio
-from pdb import set_trace
-from time import sleep
+from instruments.instrument_asynchronous import AsyncInstrument
+from instruments.ismatec.ismatec import ACK, CR
 
 __author__ = "Brent Maranzano"
 __license__ = "MIT"
@@ -17,68 +16,100 @@ __license__ = "MIT"
 logger = logging.getLogger("instrument.ismatec")
 
 
-class Ismatec():
-    """Ismatec pump controller.
+class Ismatec(AsyncInstrument):
+    """Ismatec pump controller with awaitable commands.
     """
 
-    def __init__(self, port):
+    def __init__(self, port, address=1, timeout=0.5, min_interval=0.0):
         """Sets an object attribute with defining the device port.
 
         Arguments
         port (str): Device port
+        address (int): Pump address (1-8) on the serial line
+        timeout (float): Time (s) to wait for a reply to a command
+        min_interval (float): Minimum gap (s) between consecutive commands
         """
-        self._connect(port)
+        super().__init__(port, timeout=timeout, min_interval=min_interval)
+        self._address = address
 
-    def _connect(self, port):
+    async def connect(self):
         """Connect to the serial instrument
-
-        Arguments
-        params (dict): Parameters to start instrument
         """
         logger.info("connecting to serial")
-        self._ser = Serial(port=port, baudrate=9600, bytesize=8,
-                           parity="N", stopbits=1, timeout=0.5)
-        self._ser.write(f"@1{chr(13)}".encode('ascii'))
-        self._ser.write(f"1M{chr(13)}".encode('ascii'))
+        await self._open(baudrate=9600, bytesize=8, parity="N", stopbits=1)
+        await self._transact(f"@{self._address}{chr(13)}", ACK)
+        await self._transact(f"{self._address}M{chr(13)}", ACK)
 
-    def start(self):
+    async def start(self):
         """Start the pump.
+
+        returns (bool): True if the pump acknowledged the command
         """
-        self._ser.write(f"1H{chr(13)}".encode('ascii'))
+        reply = await self._transact(f"{self._address}H{chr(13)}", ACK)
+        return reply == b"*"
 
-    def stop(self):
+    async def stop(self):
         """Stop the pump.
+
+        returns (bool): True if the pump acknowledged the command
         """
-        self._ser.write(f"1I{chr(13)}".encode('ascii'))
+        reply = await self._transact(f"{self._address}I{chr(13)}", ACK)
+        return reply == b"*"
 
-    def set_flowrate(self, val):
+    async def set_flowrate(self, val):
         """Set the pump rpm (1/min)
 
         Argument
         val (float): Pump RPMs (1/min)
+
+        returns (bool): True if the pump acknowledged the command
         """
         val = str(int(val)).zfill(5)
-        self._ser.write(f"1S{val}{chr(13)}".encode('ascii'))
+        reply = await self._transact(f"{self._address}S{val}{chr(13)}", ACK)
+        return reply == b"*"
 
-    def get_flowrate(self):
+    async def get_flowrate(self):
         """Get the pump rpm (1/min)
+
+        returns (float): Pump RPMs (1/min)
         """
-        self._ser.write(f"1S{chr(13)}".encode('ascii'))
+        reply = await self._transact(f"{self._address}S{chr(13)}", CR)
+        return float(reply.decode().strip().strip("*"))
 
-    async def send(w, command):
-        w.write(command)
-        await asyncio.sleep(0.3)
+
+async def main(ports, address=1):
+    """Run the pumps on all ports concurrently from one event loop.
+
+    Arguments
+    ports (list): Device ports
+    address (int): Address of the pumps on their lines
+    """
+    pumps = [Ismatec(port, address) for port in ports]
+    await asyncio.gather(*[pump.connect() for pump in pumps])
+    await asyncio.gather(*[pump.set_flowrate(944) for pump in pumps])
+    await asyncio.gather(*[pump.start() for pump in pumps])
+    print(await asyncio.gather(*[pump.get_flowrate() for pump in pumps]))
+    await asyncio.sleep(5)
+    await asyncio.gather(*[pump.stop() for pump in pumps])
+    await asyncio.gather(*[pump.close() for pump in pumps])
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
-        description="Service to call queued Bronkhorst serial methods."
+        description="Service to call asynchronous Ismatec serial methods."
     )
     parser.add_argument(
         "--port",
-        help="Device port instrument is connected",
+        help="Device ports instruments are connected",
         type=str,
-        default="/dev/ttyUSB0"
+        nargs="+",
+        default=["/dev/ttyUSB0"]
+    )
+    parser.add_argument(
+        "--address",
+        help="Pump address on the serial lines",
+        type=int,
+        default=1
     )
     parser.add_argument(
         "--debug_level",
@@ -87,15 +118,4 @@ if __name__ == "__main__":
         default="INFO"
     )
     args = parser.parse_args()
-    instrument = Ismatec(args.port)
-    instrument.main()
-    instrument.set_flowrate(944)
-    instrument.start()
-    instrument.get_flowrate(callback=print)
-    sleep(5)
-    instrument.stop()
-    try:
-        while instrument._queue.empty() is False:
-            pass
-    except KeyboardInterrupt:
-        pass
+    asyncio.run(main(args.port, args.address))
@@ -5,8 +5,9 @@ Ismatec pump control
 """
 import argparse
 import logging
-from serial import Serial
 from instruments.instrument import Instrument
+from instruments.ismatec.ismatec import ACK, CR
+from instruments.request_queue import CRITICAL
 from pdb import set_trace
 from time import sleep
 
@@ -36,22 +37,23 @@ class Ismatec(Instrument):
         params (dict): Parameters to start instrument
         """
         logger.info("connecting to serial")
-        self._ser = Serial(port=self._port, baudrate=9600, bytesize=8,
-                           parity="N", stopbits=1, timeout=0.5)
-        self._ser.write(f"@1{chr(13)}".encode('ascii'))
-        self._ser.write(f"1M{chr(13)}".encode('ascii'))
+        self._open_port(baudrate=9600, bytesize=8, parity="N", stopbits=1)
+        self._transact(f"@1{chr(13)}", ACK)
+        self._transact(f"1M{chr(13)}", ACK)
 
     def start(self, callback=None):
         """Start the pump.
         """
         command = f"1H{chr(13)}".encode('ascii')
-        self._queue_request(command=command, callback=callback)
+        return self._queue_request(command=command, terminators=ACK,
+                                   callback=callback)
 
     def stop(self, callback=None):
         """Stop the pump.
         """
         command = f"1I{chr(13)}".encode('ascii')
-        self._queue_request(command=command, callback=callback)
+        return self._queue_request(command=command, terminators=ACK,
+                                   priority=CRITICAL, callback=callback)
 
     def set_flowrate(self, val, callback=None):
         """Set the pump rpm (1/min)
@@ -61,13 +63,15 @@ class Ismatec(Instrument):
         """
         val = str(int(val)).zfill(5)
         command = f"1S{val}{chr(13)}".encode('ascii')
-        self._queue_request(command=command, callback=callback)
+        return self._queue_request(command=command, terminators=ACK,
+                                   callback=callback)
 
     def get_flowrate(self, callback=None):
         """Get the pump rpm (1/min)
         """
         command = f"1S{chr(13)}".encode('ascii')
-        self._queue_request(command=command, callback=callback)
+        return self._queue_request(command=command, terminators=CR,
+                                   callback=callback)
 
     def main(self):
         """Entry point
@@ -97,11 +101,6 @@ if __name__ == "__main__":
     instrument.main()
     instrument.set_flowrate(944)
     instrument.start()
-    instrument.get_flowrate(callback=print)
+    print(instrument.get_flowrate().result(timeout=5))
     sleep(5)
-    instrument.stop()
-    try:
-        while instrument._queue.empty() is False:
-            pass
-    except KeyboardInterrupt:
-        pass
+    instrument.stop().result(timeout=5)
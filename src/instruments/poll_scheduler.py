@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Interest driven, adaptive scheduling of instrument polls
+"""
+import threading
+import logging
+from time import monotonic
+
+
+__author__ = "Brent Maranzano"
+__license__ = "MIT"
+
+
+logger = logging.getLogger("instrument.poll_scheduler")
+
+
+class PollScheduler(object):
+    """Plan the polls of instrument readings. Only readings a consumer (e.g.
+    an OPC node or MQTT topic) registered interest in are polled. The poll
+    interval of a reading adapts between its minimum and maximum: it halves
+    while the value changes and grows while the value is stable.
+
+    The polls are planned within the byte budget of the serial link. When the
+    desired rates exceed the budget, the budget is shared in proportion to the
+    number of consumers of each reading (water filling), so readings with few
+    consumers are stretched first.
+    """
+
+    def __init__(self, baudrate=9600, utilization=0.5, bits_per_byte=10):
+        """Create the scheduler.
+
+        Arguments
+        baudrate (int): Baudrate of the serial link
+        utilization (float): Fraction of the link available to polling
+        bits_per_byte (int): Bits on the line per byte (start, data, parity
+            and stop bits)
+        """
+        self._budget = baudrate / bits_per_byte * utilization  # bytes/s
+        self._entries = {}
+        self._condition = threading.Condition()
+
+    def register(self, key, consumer, min_interval=0.5, max_interval=10.0,
+                 tolerance=0.0, cost=16):
+        """Register interest of a consumer in a reading.
+
+        Arguments
+        key (str): Name of the reading
+        consumer (hashable): Identifier of the consumer (e.g. node name)
+        min_interval (float): Shortest poll interval (s) of the consumer
+        max_interval (float): Longest poll interval (s) of the consumer
+        tolerance (float): Change of a numeric value considered as stable
+        cost (int): Bytes on the line to poll the reading (command and reply)
+        """
+        with self._condition:
+            entry = self._entries.setdefault(key, {
+                "consumers": {}, "interval": min_interval, "due": monotonic(),
+                "value": None, "busy": False, "tolerance": tolerance,
+                "cost": cost
+            })
+            entry["consumers"][consumer] = (min_interval, max_interval)
+            entry["interval"] = min(entry["interval"], self._max(entry))
+            entry["due"] = min(entry["due"], monotonic() + self._min(entry))
+            self._condition.notify_all()
+
+    def release(self, key, consumer):
+        """Release the interest of a consumer in a reading. Readings without
+        consumers are no longer polled.
+
+        Arguments
+        key (str): Name of the reading
+        consumer (hashable): Identifier of the consumer
+        """
+        with self._condition:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry["consumers"].pop(consumer, None)
+            if not entry["consumers"]:
+                del self._entries[key]
+
+    def _min(self, entry):
+        return min(c[0] for c in entry["consumers"].values())
+
+    def _max(self, entry):
+        return max(self._min(entry),
+                   min(c[1] for c in entry["consumers"].values()))
+
+    def _planned_intervals(self):
+        """Stretch the desired intervals to fit the byte budget.
+
+        returns (dict): Keys are reading names, values are intervals (s).
+        """
+        entries = self._entries
+        desired = {k: e["cost"] / e["interval"] for k, e in entries.items()}
+        if sum(desired.values()) <= self._budget:
+            return {k: e["interval"] for k, e in entries.items()}
+        # water filling: bandwidth of a reading is min(desired, level *
+        # weight), the level is raised until the budget is used up
+        weights = {k: len(e["consumers"]) for k, e in entries.items()}
+        budget = self._budget
+        bandwidth = {}
+        order = sorted(entries, key=lambda k: desired[k] / weights[k])
+        total_weight = sum(weights.values())
+        for key in order:
+            level = budget / total_weight
+            bandwidth[key] = min(desired[key], level * weights[key])
+            budget -= bandwidth[key]
+            total_weight -= weights[key]
+        return {k: entries[k]["cost"] / bandwidth[k] for k in entries}
+
+    def wait_due(self, timeout=None):
+        """Wait until readings are due and mark them as being polled.
+
+        Arguments
+        timeout (float): Maximum time (s) to wait
+
+        returns (list): Names of the readings to poll
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._condition:
+            while True:
+                now = monotonic()
+                idle = [e for e in self._entries.values() if not e["busy"]]
+                due = [k for k, e in self._entries.items()
+                       if not e["busy"] and e["due"] <= now]
+                if due:
+                    for key in due:
+                        self._entries[key]["busy"] = True
+                    return sorted(due, key=lambda k: self._entries[k]["due"])
+                wait = min([e["due"] - now for e in idle], default=None)
+                if deadline is not None:
+                    if now >= deadline:
+                        return []
+                    wait = deadline - now if wait is None else min(
+                        wait, deadline - now)
+                self._condition.wait(wait)
+
+    def update(self, key, value):
+        """Record the result of a poll and plan the next one.
+
+        Arguments
+        key (str): Name of the reading
+        value (varies): Value polled, None if the poll failed
+        """
+        with self._condition:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry["busy"] = False
+            if value is not None:
+                if self._changed(entry, value):
+                    entry["interval"] = max(self._min(entry),
+                                            entry["interval"] / 2)
+                else:
+                    entry["interval"] = min(self._max(entry),
+                                            entry["interval"] * 1.5)
+                entry["value"] = value
+            interval = self._planned_intervals()[key]
+            entry["due"] = monotonic() + interval
+            self._condition.notify_all()
+
+    def _changed(self, entry, value):
+        """Check whether a polled value differs from the previous one.
+
+        Arguments
+        entry (dict): Scheduling state of the reading
+        value (varies): Value polled
+
+        returns (bool): True if the value changed beyond the tolerance
+        """
+        last = entry["value"]
+        if last is None:
+            return True
+        try:
+            return abs(value - last) > entry["tolerance"]
+        except TypeError:
+            return value != last
+
+    def stats(self):
+        """Get the scheduling state.
+
+        returns (dict): readings (keys are reading names, values are
+            dictionaries of consumers (number of consumers), interval
+            (adapted interval (s)) and planned (interval (s) after fitting
+            the budget)), utilization (fraction of the budget planned)
+        """
+        with self._condition:
+            planned = self._planned_intervals()
+            readings = {k: {"consumers": len(e["consumers"]),
+                            "interval": e["interval"],
+                            "planned": planned[k]}
+                        for k, e in self._entries.items()}
+            utilization = sum(e["cost"] / planned[k]
+                              for k, e in self._entries.items())
+            return {"readings": readings,
+                    "utilization": utilization / self._budget}
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Instrument request queue
+"""
+import queue
+import logging
+from collections import deque
+from time import monotonic
+
+
+__author__ = "Brent Maranzano"
+__license__ = "MIT"
+
+
+logger = logging.getLogger("instrument.request_queue")
+
+
+# Priority lanes, lower lanes are served first.
+CRITICAL = 0
+NORMAL = 1
+BACKGROUND = 2
+LANES = 3
+
+
+class RequestQueue(queue.Queue):
+    """Queue of instrument requests (see Instrument._queue_request) with
+    priority lanes. A request carries its lane in the "priority" key
+    (default NORMAL, BACKGROUND for polling). Lower lanes are served first,
+    requests within a lane are served in FIFO order. The time requests of
+    the CRITICAL lane wait in the queue is recorded.
+
+    With coalescing enabled, a request carrying a "coalesce" key (e.g. the
+    name of the set point it writes) replaces a pending request of its lane
+    with the same key, as long as no ordered command (a request without
+    "coalesce" key) was queued in between. The replacement takes the queue
+    position of the older request, whose future is resolved with the result
+    of the newer one.
+
+    Reads of the same value (requests with the same "cache" key) are
+    collapsed: a read attaches to a pending read with the same key in its
+    lane or a more critical one, and receives its result, unless a write to
+    that value (a request with the read key as "coalesce" key) or an ordered
+    command is served between the two.
+
+    A bounded queue (maxsize > 0) handles a put to a full queue according to
+    its overflow policy:
+        block: wait for a free slot (or raise queue.Full on timeout)
+        reject: raise queue.Full
+        drop_oldest: evict the oldest request of the least critical
+            non-empty lane, its futures fail with queue.Full. Raise
+            queue.Full if only CRITICAL requests are pending.
+    CRITICAL requests and requests that replace a pending one are always
+    accepted.
+
+    A CRITICAL command (a request without "cache" key, e.g. stop) supersedes
+    the commands pending in the other lanes: they are removed and their
+    futures cancelled, so a start or set point queued before a stop cannot
+    be served after it. Pending reads are kept.
+    """
+
+    OVERFLOW = ("block", "reject", "drop_oldest")
+
+    def __init__(self, maxsize=0, coalesce=False, overflow="block"):
+        """Create the queue.
+
+        Arguments
+        maxsize (int): Maximum number of queued requests, 0 is unbounded
+        coalesce (bool): Replace pending writes to the same parameter
+        overflow (str): Policy when the queue is full (see OVERFLOW)
+        """
+        if overflow not in self.OVERFLOW:
+            raise ValueError(f"overflow must be one of {self.OVERFLOW}")
+        super().__init__(maxsize)
+        self._coalesce = coalesce
+        self._overflow = overflow
+        self.coalesced = 0  # number of requests replaced by newer ones
+        self.collapsed = 0  # number of reads attached to pending reads
+        self.rejected = 0  # number of requests refused on overflow
+        self.dropped = 0  # number of requests evicted on overflow
+        self.superseded = 0  # number of commands cancelled by a CRITICAL one
+        self.high_water = 0  # largest depth reached
+        self._critical_waits = 0
+        self._critical_wait_total = 0.0
+        self._critical_wait_max = 0.0
+
+    def _init(self, maxsize):
+        self.queue = [deque() for _ in range(LANES)]
+
+    def _qsize(self):
+        return sum(len(lane) for lane in self.queue)
+
+    def put(self, request, block=True, timeout=None):
+        """Put a request in the queue, applying the overflow policy if the
+        queue is full.
+
+        Arguments
+        request (dict): Request (see Instrument._queue_request)
+        block (bool): Wait for a free slot (block policy only)
+        timeout (float): Maximum time (s) to wait for a free slot
+        """
+        evicted = None
+        superseded = []
+        with self.not_full:
+            pending = self._pending_read(request)
+            if pending is not None:
+                pending.setdefault("followers", []).append(
+                    (request["future"], request.get("callback")))
+                self.collapsed += 1
+                return
+            if (request.get("priority", NORMAL) == CRITICAL
+                    and request.get("cache") is None):
+                superseded = self._supersede()
+            if (self.maxsize > 0 and self._qsize() >= self.maxsize
+                    and request.get("priority", NORMAL) != CRITICAL
+                    and self._merge_index(request) is None):
+                if self._overflow == "drop_oldest":
+                    evicted = self._evict()
+                if evicted is None:
+                    self._wait_not_full(block, timeout)
+            self._put(request)
+            self.unfinished_tasks += 1
+            self.high_water = max(self.high_water, self._qsize())
+            self.not_empty.notify()
+        if evicted is not None:
+            logger.warning(f"queue full, dropped {evicted.get('command')!r}")
+            self._fail(evicted, queue.Full("request dropped, queue full"))
+        for pending in superseded:
+            logger.info(f"{pending.get('command')!r} superseded by "
+                        f"{request.get('command')!r}")
+            self._cancel(pending)
+
+    def _wait_not_full(self, block, timeout):
+        """Wait for a free slot, called with the mutex held.
+
+        Arguments
+        block (bool): Wait for a free slot (block policy only)
+        timeout (float): Maximum time (s) to wait
+        """
+        if self._overflow == "block" and block:
+            if self.not_full.wait_for(
+                    lambda: self._qsize() < self.maxsize, timeout):
+                return
+        self.rejected += 1
+        raise queue.Full("request rejected, queue full")
+
+    def _evict(self):
+        """Remove the oldest request of the least critical non-empty lane,
+        called with the mutex held.
+
+        returns (dict): The request or None if only CRITICAL requests are
+            pending
+        """
+        for lane in reversed(self.queue[CRITICAL + 1:]):
+            if lane:
+                self.dropped += 1
+                return lane.popleft()
+        return None
+
+    def _supersede(self):
+        """Remove the commands (requests without "cache" key) pending in the
+        lanes below CRITICAL, called with the mutex held.
+
+        returns (list): Removed requests
+        """
+        removed = []
+        for priority in range(CRITICAL + 1, LANES):
+            kept = deque()
+            for pending in self.queue[priority]:
+                if pending.get("cache") is None:
+                    removed.append(pending)
+                else:
+                    kept.append(pending)
+            self.queue[priority] = kept
+        if removed:
+            self.superseded += len(removed)
+            self.not_full.notify(len(removed))
+        return removed
+
+    @staticmethod
+    def _cancel(request):
+        """Cancel the futures of a request that will not be processed.
+
+        Arguments
+        request (dict): Request
+        """
+        waiters = [(request["future"], None)] + request.get("followers", [])
+        for future, _ in waiters:
+            future.cancel()
+
+    @staticmethod
+    def _fail(request, error):
+        """Fail the futures of a request that will not be processed.
+
+        Arguments
+        request (dict): Request
+        error (Exception): Exception set on the futures
+        """
+        waiters = [(request["future"], None)] + request.get("followers", [])
+        for future, _ in waiters:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(error)
+
+    def _pending_read(self, request):
+        """Find a pending read of the same value, called with the mutex held.
+
+        Arguments
+        request (dict): Request
+
+        returns (dict): Pending read served no later than the request, with
+            no write to the value or ordered command served in between.
+            None if the request is not a read or no such read is pending.
+        """
+        key = request.get("cache")
+        if key is None:
+            return None
+        # scan the requests served before this one, latest first
+        for lane in reversed(self.queue[:request.get("priority", NORMAL) + 1]):
+            for pending in reversed(lane):
+                if pending.get("cache") == key:
+                    return pending
+                written = pending.get("coalesce")
+                if written == key or (written is None
+                                      and pending.get("cache") is None):
+                    return None
+        return None
+
+    def has_barrier(self, key):
+        """Check whether a write to a value, or an ordered command, is
+        pending, so a later read of the value must not reuse an earlier one.
+
+        Arguments
+        key (str): Cache key of the value
+
+        returns (bool): True if such a request is queued
+        """
+        with self.mutex:
+            for lane in self.queue:
+                for pending in lane:
+                    written = pending.get("coalesce")
+                    if written == key or (written is None
+                                          and pending.get("cache") is None):
+                        return True
+        return False
+
+    def _merge_index(self, request):
+        """Find the pending request a request replaces.
+
+        Arguments
+        request (dict): Request
+
+        returns (int): Position of the pending request in the lane of the
+            request, None if the request is not coalesced
+        """
+        key = request.get("coalesce") if self._coalesce else None
+        if key is None:
+            return None
+        lane = self.queue[request.get("priority", NORMAL)]
+        for i in range(len(lane) - 1, -1, -1):
+            pending = lane[i].get("coalesce")
+            if pending is None:
+                return None
+            if pending == key:
+                return i
+        return None
+
+    def _put(self, request):
+        request["queued"] = monotonic()
+        lane = self.queue[request.get("priority", NORMAL)]
+        i = self._merge_index(request)
+        if i is None:
+            lane.append(request)
+            return
+        pending = lane[i]
+        request["followers"] = pending.get("followers", []) + [
+            (pending["future"], pending.get("callback"))]
+        lane[i] = request
+        self.coalesced += 1
+
+    def _get(self):
+        for priority, lane in enumerate(self.queue):
+            if lane:
+                request = lane.popleft()
+                if priority == CRITICAL:
+                    wait = monotonic() - request["queued"]
+                    self._critical_waits += 1
+                    self._critical_wait_total += wait
+                    self._critical_wait_max = max(self._critical_wait_max,
+                                                  wait)
+                return request
+
+    def get_critical(self):
+        """Remove and return a request of the CRITICAL lane without blocking,
+        so a scheduler serving several queues can serve their CRITICAL
+        lanes first.
+
+        returns (dict): Request, raises queue.Empty if the CRITICAL lane is
+            empty
+        """
+        with self.not_empty:
+            if not self.queue[CRITICAL]:
+                raise queue.Empty
+            request = self._get()
+            self.not_full.notify()
+            return request
+
+    def stats(self):
+        """Get the queue statistics.
+
+        returns (dict): depth (number of queued requests per lane),
+            maxsize (bound of the queue, 0 if unbounded), high_water
+            (largest depth reached), coalesced (number of requests replaced
+            by newer ones), collapsed (number of reads attached to a pending
+            read), rejected and dropped (number of requests refused
+            and evicted on overflow), superseded (number of commands
+            cancelled by a CRITICAL command), critical_wait (count, mean and max
+            time (s) requests of the CRITICAL lane waited in the queue)
+        """
+        with self.mutex:
+            count = self._critical_waits
+            return {
+                "depth": [len(lane) for lane in self.queue],
+                "maxsize": self.maxsize,
+                "high_water": self.high_water,
+                "coalesced": self.coalesced,
+                "collapsed": self.collapsed,
+                "rejected": self.rejected,
+                "dropped": self.dropped,
+                "superseded": self.superseded,
+                "critical_wait": {
+                    "count": count,
+                    "mean": self._critical_wait_total / count if count else 0.0,
+                    "max": self._critical_wait_max
+                }
+            }
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Response framed serial transactions.
+"""
+import logging
+import threading
+from time import monotonic, sleep
+from serial import Serial
+
+
+__author__ = "Brent Maranzano"
+__license__ = "MIT"
+
+
+logger = logging.getLogger("instrument.transport")
+
+
+class SerialTransport(object):
+    """Write a command to a serial device and read the reply until one of the
+    protocol terminators arrives. The pace of communication is set by the
+    device rather than by fixed delays. Transactions are thread safe, so a
+    port may be shared by several instruments.
+    """
+
+    def __init__(self, ser, timeout=0.5, min_interval=0.0, poll=0.05):
+        """Wrap an open serial port.
+
+        Arguments
+        ser (Serial): Open serial port
+        timeout (float): Default time (s) to wait for a complete reply
+        min_interval (float): Minimum gap (s) between the end of one
+            transaction and the start of the next
+        poll (float): Read timeout (s) of the port, bounds the overshoot
+            of a transaction timeout
+        """
+        self._ser = ser
+        self._ser.timeout = poll
+        self._timeout = timeout
+        self._min_interval = min_interval
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def transact(self, command, terminators=None, timeout=None):
+        """Write a command and read the reply.
+
+        Arguments
+        command (bytes): Command frame to write
+        terminators (tuple): Byte strings that end a reply. If None the
+            command is written and no reply is read.
+        timeout (float): Time (s) to wait for the reply, defaults to the
+            transport timeout.
+
+        returns (bytes): Reply including the terminator, or None
+        """
+        with self._lock:
+            wait = self._min_interval - (monotonic() - self._last)
+            if wait > 0:
+                sleep(wait)
+            try:
+                # discard stale bytes (e.g. trailing LF of the previous reply)
+                self._ser.reset_input_buffer()
+                self._ser.write(command)
+                if terminators is None:
+                    self._ser.flush()
+                    return None
+                return self._read_until(
+                    command, terminators,
+                    self._timeout if timeout is None else timeout)
+            finally:
+                self._last = monotonic()
+
+    def _read_until(self, command, terminators, timeout):
+        """Read from the port until the reply ends with a terminator.
+
+        Arguments
+        command (bytes): Command that was written (for error reporting)
+        terminators (tuple): Byte strings that end a reply
+        timeout (float): Time (s) to wait for the reply
+
+        returns (bytes): Reply up to and including the first terminator
+        """
+        deadline = monotonic() + timeout
+        reply = b""
+        while True:
+            reply += self._ser.read(self._ser.in_waiting or 1)
+            ends = [reply.find(t) + len(t) for t in terminators if t in reply]
+            if ends:
+                return reply[:min(ends)]
+            if monotonic() > deadline:
+                logger.warning(f"timeout waiting for reply to {command!r}, "
+                               f"received {reply!r}")
+                raise TimeoutError(
+                    f"no reply to {command!r} within {timeout} s")
+
+    def close(self):
+        """Close the serial port.
+        """
+        with self._lock:
+            self._ser.close()
+
+
+def open_transport(port, timeout=0.5, min_interval=0.0, **serial_params):
+    """Open the transport of a device port: a pooled TCP connection if the
+    port is "tcp://host:port" (LAN attached device or serial device server),
+    otherwise a serial port.
+
+    Arguments
+    port (str): Device port
+    timeout (float): Default time (s) to wait for a complete reply
+    min_interval (float): Minimum gap (s) between consecutive transactions
+    serial_params: Parameters of the serial port (e.g. baudrate)
+
+    returns (SerialTransport or SocketTransport): transport
+    """
+    if port.startswith("tcp://"):
+        # only instruments on the network need the socket service
+        from services.socket.transport import SocketPool
+        host, tcp_port = port[len("tcp://"):].rsplit(":", 1)
+        return SocketPool.get(host, tcp_port, timeout=timeout,
+                              min_interval=min_interval)
+    return SerialTransport(Serial(port=port, **serial_params),
+                           timeout=timeout, min_interval=min_interval)
+
+
+def close_transport(port, transport):
+    """Close a transport opened by open_transport. A pooled TCP connection
+    is released, it stays open while other instruments use it.
+
+    Arguments
+    port (str): Device port the transport was opened for
+    transport (SerialTransport or SocketTransport): transport
+    """
+    if port.startswith("tcp://"):
+        from services.socket.transport import SocketPool
+        SocketPool.release(transport)
+    else:
+        transport.close()
@@ -13,8 +13,7 @@ __author__ = "Brent Maranzano"
 __license__ = "MIT"
 
 
-ismatec = Ismatec("/dev/ttyUSB0")
-ismatec.main()
+ismatec = None  # pump, connected by main
 
 
 def run_command(name, value):
@@ -25,10 +24,15 @@ def run_command(name, value):
         else:
             print("stop")
             ismatec.stop()
+    elif name == "SET_FLOWRATE_CONTROLLER":
+        ismatec.set_flowrate(value)
 
 
-def main():
-    sub = Subscriber.from_file("./project/parameter_file.yml")
+def main(port="/dev/ttyUSB0", parameter_file="./project/parameter_file.yml"):
+    global ismatec
+    ismatec = Ismatec(port)
+    ismatec.main()
+    sub = Subscriber.from_file(parameter_file)
     sub.set_callback(run_command)
     sub.run()
 
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+MQTT service connecting instruments to a broker.
+"""
+import argparse
+import json
+import logging
+import threading
+from collections import OrderedDict, deque
+from time import monotonic, sleep
+import paho.mqtt.client as mqtt
+
+__author__ = "Brent Maranzano"
+__license__ = "MIT"
+
+
+logger = logging.getLogger("instrument.mqtt")
+
+_UNSET = object()  # marks readings that were never published
+
+
+def _default(value):
+    """Encode values JSON does not support (e.g. raw instrument replies).
+    """
+    if isinstance(value, bytes):
+        return value.decode("ascii", "replace").strip()
+    return str(value)
+
+
+class MqttClient(object):
+    """Connection to an MQTT broker shared by the instruments of a process.
+
+    An instrument registers under a name and a map of the commands it
+    accepts. Messages on the command topics "<prefix>/<name>/command/<topic>"
+    of a mapped topic are passed to its callback as a request (command,
+    parameters (JSON payload) and callback), the result is published to
+    "<prefix>/<name>/response/<topic>". Messages on other topics are
+    rejected. Every publish interval, the readings of the instrument (its
+    telemetry function) that changed since the last cycle are published in
+    one message to "<prefix>/<name>/telemetry", retained so new subscribers
+    get the last values.
+
+    Outbound messages are buffered and drained by the network thread, so
+    publishing never blocks the caller. Retained messages (e.g. telemetry)
+    carry the last value of their topic: a pending one is replaced by a
+    newer one on the same topic, and the oldest one is dropped when the
+    buffer is full. Other messages (e.g. command responses) are sent in
+    order, none is replaced or dropped.
+    """
+
+    _clients = dict()  # map between (host, port) and shared MqttClient
+    _clients_lock = threading.Lock()
+
+    def __init__(self, host="localhost", port=1883, prefix="instruments",
+                 qos=1, retain=True, publish_interval=1.0, buffer_size=1000,
+                 keepalive=60, client_id=""):
+        """Create the client.
+
+        Arguments
+        host (str): Broker address
+        port (int): Broker port
+        prefix (str): First level of the instrument topics
+        qos (int): Quality of service of published messages
+        retain (bool): Retain the telemetry messages on the broker
+        publish_interval (float): Period (s) of the telemetry cycle
+        buffer_size (int): Maximum number of pending retained messages
+        keepalive (int): Keepalive period (s) of the broker connection
+        client_id (str): Client identifier, random if empty
+        """
+        self._host = host
+        self._port = port
+        self._prefix = prefix
+        self._qos = qos
+        self._retain = retain
+        self._publish_interval = publish_interval
+        self._buffer_size = buffer_size
+        self._keepalive = keepalive
+        self._instruments = dict()  # map between name and registration
+        self._buffer = OrderedDict()  # map between topic and message
+        self._fifo = deque()  # (topic, message) of non retained messages
+        self._buffer_lock = threading.Condition()
+        self._stats = {"published": 0, "replaced": 0, "dropped": 0,
+                       "commands": 0}
+        self._started = False
+        self._client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2,
+                                   client_id=client_id)
+        self._client.max_queued_messages_set(buffer_size)
+        self._client.on_connect = self._on_connect
+        self._client.on_message = self._on_message
+
+    @classmethod
+    def shared(cls, host="localhost", port=1883, **params):
+        """Get the client of a broker shared by the process, create it on
+        first use.
+
+        Arguments
+        host (str): Broker address
+        port (int): Broker port
+        params: Other parameters of the client (see __init__), used when
+            the client is created
+
+        returns (MqttClient): client
+        """
+        with cls._clients_lock:
+            client = cls._clients.get((host, port))
+            if client is None:
+                client = cls(host, port, **params)
+                cls._clients[(host, port)] = client
+            return client
+
+    @classmethod
+    def run(cls, callback, name, host="localhost", port=1883, commands=None,
+            telemetry=None, **params):
+        """Register an instrument on the shared client of a broker and start
+        the client.
+
+        Arguments
+        callback (func): Function receiving the requests (command,
+            parameters and callback keyword arguments)
+        name (str): Name of the instrument in the topics
+        host (str): Broker address
+        port (int): Broker port
+        commands (dict): Map between command topic names and the commands
+            passed to the callback, only these topics are accepted
+        telemetry (func): Function returning the readings to publish (a
+            dictionary of values or Readings)
+        params: Other parameters of the client (see __init__)
+
+        returns (MqttClient): client
+        """
+        client = cls.shared(host, port, **params)
+        client.add_instrument(name, callback, commands, telemetry)
+        client.start()
+        return client
+
+    def add_instrument(self, name, callback, commands=None, telemetry=None):
+        """Register an instrument.
+
+        Arguments
+        name (str): Name of the instrument in the topics
+        callback (func): Function receiving the requests
+        commands (dict): Map between command topic names and commands, only
+            these topics are accepted
+        telemetry (func): Function returning the readings to publish
+        """
+        self._instruments[name] = {"callback": callback,
+                                   "commands": commands or dict(),
+                                   "telemetry": telemetry,
+                                   "published": dict()}
+        if self._started:
+            self._client.subscribe(self._command_topic(name), self._qos)
+
+    def _command_topic(self, name):
+        return f"{self._prefix}/{name}/command/+"
+
+    def start(self):
+        """Connect to the broker and start the network and publish threads.
+        Calling it again has no effect.
+        """
+        if self._started:
+            return
+        self._started = True
+        self._client.connect_async(self._host, self._port, self._keepalive)
+        self._client.loop_start()
+        threading.Thread(target=self._send_loop, daemon=True).start()
+        threading.Thread(target=self._telemetry_loop, daemon=True).start()
+        logger.info(f"MQTT client of {self._host}:{self._port} started")
+
+    def stop(self):
+        """Disconnect from the broker.
+        """
+        self._client.disconnect()
+        self._client.loop_stop()
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        """Subscribe to the command topics on every (re)connection.
+        """
+        if reason_code.is_failure:
+            logger.error(f"MQTT connection refused: {reason_code}")
+            return
+        logger.info(f"connected to MQTT broker {self._host}:{self._port}")
+        for name in list(self._instruments):
+            client.subscribe(self._command_topic(name), self._qos)
+
+    def _on_message(self, client, userdata, message):
+        """Pass a command message to the callback of its instrument.
+        """
+        try:
+            _, name, _, topic = message.topic.rsplit("/", 3)
+            instrument = self._instruments[name]
+            command = instrument["commands"][topic]
+        except (ValueError, KeyError):
+            logger.warning(f"unknown command topic {message.topic}")
+            return
+        try:
+            parameters = json.loads(message.payload) if message.payload \
+                else None
+        except ValueError:
+            parameters = message.payload.decode("utf-8", "replace")
+        self._stats["commands"] += 1
+        response = f"{self._prefix}/{name}/response/{topic}"
+        instrument["callback"](
+            command=command, parameters=parameters,
+            callback=lambda result: self.publish(response, result,
+                                                 retain=False))
+
+    def publish(self, topic, value, qos=None, retain=None):
+        """Queue a message without waiting for the broker.
+
+        Arguments
+        topic (str): Topic
+        value (varies): JSON serializable payload
+        qos (int): Quality of service, defaults to the client setting
+        retain (bool): Retain the message, defaults to the client setting
+        """
+        retain = self._retain if retain is None else retain
+        message = (json.dumps(value, default=_default),
+                   self._qos if qos is None else qos, retain)
+        with self._buffer_lock:
+            if not retain:
+                self._fifo.append((topic, message))
+            else:
+                if topic in self._buffer:
+                    self._stats["replaced"] += 1
+                elif len(self._buffer) >= self._buffer_size:
+                    self._buffer.popitem(last=False)
+                    self._stats["dropped"] += 1
+                self._buffer[topic] = message
+            self._buffer_lock.notify()
+
+    def _send_loop(self):
+        """Hand the buffered messages to the network thread.
+        """
+        while True:
+            with self._buffer_lock:
+                self._buffer_lock.wait_for(lambda: self._buffer or self._fifo)
+                fifo, self._fifo = self._fifo, deque()
+                retained, self._buffer = self._buffer, OrderedDict()
+            messages = list(fifo) + list(retained.items())
+            for topic, (payload, qos, retain) in messages:
+                self._client.publish(topic, payload, qos, retain)
+            self._stats["published"] += len(messages)
+
+    def _telemetry(self, name, instrument):
+        """Get the readings of an instrument that changed since they were
+        last published.
+
+        Arguments
+        name (str): Name of the instrument
+        instrument (dict): Registration of the instrument
+
+        returns (dict): Keys are reading names, values are the readings
+        """
+        changed = dict()
+        for key, reading in instrument["telemetry"]().items():
+            value = getattr(reading, "value", reading)
+            if instrument["published"].get(key, _UNSET) != value:
+                instrument["published"][key] = value
+                changed[key] = value
+        return changed
+
+    def _telemetry_loop(self):
+        """Publish the changed readings of all instruments every publish
+        interval, one message per instrument.
+        """
+        while True:
+            start = monotonic()
+            for name, instrument in list(self._instruments.items()):
+                if instrument["telemetry"] is None:
+                    continue
+                try:
+                    changed = self._telemetry(name, instrument)
+                except Exception:
+                    logger.exception(f"reading telemetry of {name} failed")
+                    continue
+                if changed:
+                    self.publish(f"{self._prefix}/{name}/telemetry", changed)
+            sleep(max(0.0, self._publish_interval - (monotonic() - start)))
+
+    def stats(self):
+        """Get the client statistics.
+
+        returns (dict): published (messages handed to the network thread),
+            replaced (pending retained messages replaced by newer ones on
+            the same topic), dropped (retained messages dropped on a full
+            buffer), commands
+            (command messages received), pending (messages in the buffer),
+            connected (bool)
+        """
+        with self._buffer_lock:
+            return dict(self._stats,
+                        pending=len(self._buffer) + len(self._fifo),
+                        connected=self._client.is_connected())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MQTT echo instrument")
+    parser.add_argument(
+        "--host",
+        help="Broker address",
+        type=str,
+        default="localhost"
+    )
+    parser.add_argument(
+        "--port",
+        help="Broker port",
+        type=int,
+        default=1883
+    )
+    parser.add_argument(
+        "--debug_level",
+        help="debugger level (e.g. INFO, WARN, DEBUG, ...)",
+        type=str,
+        default="INFO"
+    )
+    args = parser.parse_args()
+
+    def echo(command, parameters, callback):
+        callback({"command": command, "parameters": parameters})
+
+    client = MqttClient.run(echo, "echo", args.host, args.port,
+                            commands={"echo": "echo"},
+                            telemetry=lambda: {"time": monotonic()})
+    while True:
+        sleep(10)
+        logger.info(f"MQTT statistics {client.stats()}")
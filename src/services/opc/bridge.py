@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Publish instrument readings to OPC UA server nodes.
+"""
+import argparse
+import logging
+import threading
+from time import monotonic, sleep
+from lib import helper_functions
+from services.opc.server import OpcServer
+from instruments.ismatec.ismatec import Ismatec
+
+__author__ = "Brent Maranzano"
+__license__ = "MIT"
+
+
+logger = logging.getLogger("services.opc.bridge")
+
+
+class InstrumentBridge(object):
+    """Map instrument readings (e.g. pump flowrate, stirrer rate_PV) to
+    OpcServer nodes. The bridge registers interest in the readings, so the
+    instruments poll them in the background, and publishes the cached
+    readings every publish interval. A reading is written only when it moved
+    beyond the deadband of its node since it was last published, and all
+    values of a cycle are written in one batch (see OpcServer.set_values).
+    """
+
+    def __init__(self, server, publish_interval=1.0):
+        """Create the bridge.
+
+        Arguments
+        server (OpcServer): Running server that owns the nodes
+        publish_interval (float): Period (s) of the publish cycle
+        """
+        self._server = server
+        self._publish_interval = publish_interval
+        self._mappings = dict()  # map between node name and mapping
+        self._stats = {"cycles": 0, "written": 0, "suppressed": 0}
+
+    @classmethod
+    def from_dictionary(cls, server, instruments, publish_interval=1.0,
+                        nodes=None):
+        """Create the bridge from a dictionary (e.g. the "bridge" section of
+        the server YAML).
+
+        Arguments
+        server (OpcServer): Running server that owns the nodes
+        instruments (dict): Keys are instrument names, values are Instruments
+        publish_interval (float): Period (s) of the publish cycle
+        nodes (dict): Keys are node names, values are dictionaries with the
+            instrument name, reading and optionally deadband, min_interval
+            and max_interval (see add)
+        """
+        bridge = cls(server, publish_interval)
+        for node, mapping in (nodes or {}).items():
+            mapping = dict(mapping)
+            instrument = instruments[mapping.pop("instrument")]
+            bridge.add(node, instrument, **mapping)
+        return bridge
+
+    def add(self, node, instrument, reading, deadband=0.0, min_interval=0.5,
+            max_interval=10.0):
+        """Publish an instrument reading to a node.
+
+        Arguments
+        node (str): Name of the server node
+        instrument (Instrument): Instrument providing the reading
+        reading (str): Name of the reading (see Instrument._readables)
+        deadband (float): Change of the value needed to publish it again
+        min_interval (float): Shortest poll interval (s) of the reading
+        max_interval (float): Longest poll interval (s) of the reading
+        """
+        instrument.register_interest(reading, f"opc:{node}", min_interval,
+                                     max_interval, tolerance=deadband)
+        self._mappings[node] = {"instrument": instrument, "reading": reading,
+                                "deadband": deadband, "value": None,
+                                "timestamp": None}
+
+    def remove(self, node):
+        """Stop publishing to a node.
+
+        Arguments
+        node (str): Name of the server node
+        """
+        mapping = self._mappings.pop(node)
+        mapping["instrument"].release_interest(mapping["reading"],
+                                               f"opc:{node}")
+
+    def _passes(self, mapping, value):
+        """Check whether a value moved beyond the deadband since it was last
+        published.
+
+        Arguments
+        mapping (dict): Mapping of the node
+        value (varies): Latest value of the reading
+
+        returns (bool): True if the value should be published
+        """
+        last = mapping["value"]
+        if last is None:
+            return True
+        try:
+            return abs(value - last) > mapping["deadband"]
+        except TypeError:
+            return value != last
+
+    def publish(self):
+        """Write the readings that passed their deadband in one batch.
+
+        returns (int): Number of values written
+        """
+        values = dict()
+        snapshots = dict()
+        for node, mapping in self._mappings.items():
+            instrument = mapping["instrument"]
+            if id(instrument) not in snapshots:
+                snapshots[id(instrument)] = instrument.snapshot()
+            reading = snapshots[id(instrument)].get(mapping["reading"])
+            if reading is None or reading.timestamp == mapping["timestamp"]:
+                continue
+            mapping["timestamp"] = reading.timestamp
+            if self._passes(mapping, reading.value):
+                values[node] = reading.value
+            else:
+                self._stats["suppressed"] += 1
+        if values:
+            results = self._server.set_values(values)
+            for (node, value), result in zip(values.items(), results):
+                if result.is_good():
+                    self._mappings[node]["value"] = value
+                else:
+                    logger.error(f"writing {node} failed: {result}")
+        self._stats["cycles"] += 1
+        self._stats["written"] += len(values)
+        return len(values)
+
+    def stats(self):
+        """Get the publish statistics.
+
+        returns (dict): cycles (number of publish cycles), written (number
+            of values written), suppressed (number of new readings within
+            the deadband)
+        """
+        return dict(self._stats)
+
+    def _publish_loop(self):
+        """Publish every publish interval.
+        """
+        logger.info("starting thread to publish instrument readings")
+        while True:
+            start = monotonic()
+            try:
+                self.publish()
+            except Exception:
+                logger.exception("publishing instrument readings failed")
+            sleep(max(0.0, self._publish_interval - (monotonic() - start)))
+
+    def run(self):
+        """Start publishing in a background thread.
+        """
+        threading.Thread(target=self._publish_loop, daemon=True).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="OPC UA server publishing Ismatec pump readings")
+    parser.add_argument(
+        "--parameter_file",
+        help="YAML file defining parameters for server and bridge",
+        type=str,
+        default="./parameter_file.yml"
+    )
+    parser.add_argument(
+        "--port",
+        help="Device port the pump is connected",
+        type=str,
+        default="/dev/ttyUSB0"
+    )
+    parser.add_argument(
+        "--debug_level",
+        help="debugger level (e.g. INFO, WARN, DEBUG, ...)",
+        type=str,
+        default="INFO"
+    )
+    args = parser.parse_args()
+    params = helper_functions.yaml_to_dict(args.parameter_file)
+    server = OpcServer(params)
+    server.run()
+    ismatec = Ismatec(args.port)
+    ismatec.main()
+    bridge = InstrumentBridge.from_dictionary(
+        server, {"ismatec": ismatec}, **params.get("bridge", {}))
+    bridge.run()
+    while True:
+        sleep(60)
+        logger.info(f"bridge statistics {bridge.stats()}")
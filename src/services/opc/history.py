@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SQLite history of OPC UA server nodes.
+"""
+import logging
+import queue
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from time import monotonic
+from opcua import ua
+from opcua.common.utils import Buffer
+from opcua.server.history import HistoryStorageInterface
+from opcua.ua.ua_binary import variant_from_binary, variant_to_binary
+
+__author__ = "Brent Maranzano"
+__license__ = "MIT"
+
+
+logger = logging.getLogger("services.opc.history")
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _to_seconds(timestamp):
+    return (timestamp - EPOCH).total_seconds()
+
+
+def _from_seconds(seconds):
+    return EPOCH + timedelta(seconds=seconds)
+
+
+class SqliteHistory(HistoryStorageInterface):
+    """History storage of node values in one SQLite table indexed by node
+    and source timestamp. Values are handed to a writer thread that inserts
+    them in batches and applies the retention (age and/or count per node),
+    so the server thread reporting the changes never waits on the disk.
+    History reads use their own connection and, with the write ahead log,
+    do not block the writer.
+    """
+
+    def __init__(self, path, batch_size=500, prune_interval=60.0):
+        """Open (or create) the history database.
+
+        Arguments
+        path (str): SQLite database file
+        batch_size (int): Maximum number of values inserted per transaction
+        prune_interval (float): Period (s) to delete values beyond retention
+        """
+        self._path = path
+        self._batch_size = batch_size
+        self._prune_interval = prune_interval
+        self._retention = dict()  # map between node and (period, count)
+        self._queue = queue.Queue()
+        self._read_lock = threading.Lock()
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS history (node TEXT, "
+                     "source REAL, server REAL, status INTEGER, value BLOB)")
+        conn.execute("CREATE INDEX IF NOT EXISTS history_node_source "
+                     "ON history (node, source)")
+        conn.commit()
+        conn.close()
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def new_historized_node(self, node_id, period, count=0):
+        """Start the history of a node.
+
+        Arguments
+        node_id (NodeId): Node
+        period (timedelta): Age of values to keep, None to keep all
+        count (int): Number of values to keep, 0 to keep all
+        """
+        self._retention[node_id.to_string()] = (period, count)
+
+    def save_node_value(self, node_id, datavalue):
+        """Queue a value for the writer thread.
+
+        Arguments
+        node_id (NodeId): Node
+        datavalue (DataValue): Value
+        """
+        self._queue.put((node_id.to_string(), datavalue))
+
+    def _write_loop(self):
+        """Insert queued values in batches and apply the retention.
+        """
+        conn = sqlite3.connect(self._path)
+        last_prune = monotonic()
+        stop = False
+        while not stop:
+            items = [self._queue.get()]
+            while len(items) < self._batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in items
+            rows = [self._row(node, dv) for node, dv in filter(None, items)]
+            try:
+                conn.executemany(
+                    "INSERT INTO history VALUES (?, ?, ?, ?, ?)", rows)
+                conn.commit()
+                if monotonic() - last_prune > self._prune_interval:
+                    self._prune(conn)
+                    last_prune = monotonic()
+            except sqlite3.Error:
+                logger.exception("writing history failed")
+        conn.close()
+
+    @staticmethod
+    def _row(node, datavalue):
+        """Make the table row of a value.
+
+        Arguments
+        node (str): NodeId string
+        datavalue (DataValue): Value
+
+        returns (tuple): row
+        """
+        now = datetime.utcnow()
+        server = datavalue.ServerTimestamp or now
+        source = datavalue.SourceTimestamp or server
+        return (node, _to_seconds(source), _to_seconds(server),
+                datavalue.StatusCode.value, variant_to_binary(datavalue.Value))
+
+    def _prune(self, conn):
+        """Delete the values beyond the retention of their node.
+
+        Arguments
+        conn (Connection): Writer connection
+        """
+        for node, (period, count) in list(self._retention.items()):
+            if period:
+                conn.execute(
+                    "DELETE FROM history WHERE node = ? AND source < ?",
+                    (node, _to_seconds(datetime.utcnow() - period)))
+            if count:
+                conn.execute(
+                    "DELETE FROM history WHERE node = ? AND source < (SELECT "
+                    "source FROM history WHERE node = ? ORDER BY source DESC "
+                    "LIMIT 1 OFFSET ?)", (node, node, count - 1))
+        conn.commit()
+
+    def read_node_history(self, node_id, start, end, nb_values):
+        """Read the values of a node in a time range (see
+        HistoryStorageInterface).
+
+        Arguments
+        node_id (NodeId): Node
+        start (datetime): Start of the range, None or the OPC UA epoch to
+            read the latest values
+        end (datetime): End of the range, None or the OPC UA epoch for now
+        nb_values (int): Maximum number of values, 0 for all
+
+        returns (tuple): list of DataValues, continuation point (source
+            timestamp of the first value not returned or None)
+        """
+        order = "ASC"
+        if start is None or start == ua.get_win_epoch():
+            order = "DESC"
+            start = ua.get_win_epoch()
+        if end is None or end == ua.get_win_epoch():
+            end = datetime.utcnow() + timedelta(days=1)
+        if start > end:
+            order = "DESC"
+            start, end = end, start
+        limit = nb_values + 1 if nb_values else -1
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT source, server, status, value FROM history WHERE "
+                f"node = ? AND source BETWEEN ? AND ? ORDER BY source {order} "
+                "LIMIT ?", (node_id.to_string(), _to_seconds(start),
+                            _to_seconds(end), limit)).fetchall()
+        results = []
+        for source, server, status, value in rows:
+            dv = ua.DataValue(variant_from_binary(Buffer(value)))
+            dv.SourceTimestamp = _from_seconds(source)
+            dv.ServerTimestamp = _from_seconds(server)
+            dv.StatusCode = ua.StatusCode(status)
+            results.append(dv)
+        cont = None
+        if nb_values and len(results) > nb_values:
+            cont = results[nb_values].SourceTimestamp
+            results = results[:nb_values]
+        return results, cont
+
+    def stop(self):
+        """Write the queued values and close the database.
+        """
+        self._queue.put(None)
+        self._writer.join()
+        self._reader.close()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Class to monitor nodes of several OPC UA servers.
+"""
+import argparse
+import logging
+import threading
+from opcua import ua
+from services.opc.subscriber import Subscriber
+from lib.helper_functions import yaml_to_dict
+
+__author__ = "Brent Maranzano"
+__license__ = "MIT"
+
+
+logger = logging.getLogger("instrument.opc.multi_client")
+
+
+class MultiSubscriber(object):
+    """Monitor nodes on several OPC UA servers from one process. Each server
+    is a named session served by its own Subscriber (client session,
+    dispatcher and connection recovery). Nodes are named "session/name",
+    where name is a name of the node in its Subscriber. One callback
+    receives the changes of all sessions.
+
+    The routing table forwards the value of a node to nodes of other
+    sessions (e.g. a DCS set point to the historian). Target nodes must be
+    monitored by their session.
+
+    A session whose server cannot be reached when run is called is logged
+    and dropped: writes to its nodes are skipped, it is left out of the
+    statistics and it is not retried (connection recovery only covers the
+    sessions that started).
+    """
+
+    def __init__(self):
+        """Create the subscriber without sessions.
+        """
+        self._sessions = dict()  # map between session name and Subscriber
+        self._failed = set()  # names of the sessions that failed to start
+        self._routes = dict()  # map between source and list of targets
+        # routes of the started sessions keyed by the names used in their
+        # notifications, map between session name and routes
+        self._resolved = dict()
+        self._callback = None
+
+    @classmethod
+    def from_dictionary(cls, **params):
+        """Instantiate the subscriber from a dictionary.
+
+        Arguments
+        params (dict): Configuration parameters. The dictionary should
+            contain:
+            sessions (dict): map between session names and the parameters
+                of their Subscriber (see Subscriber.from_dictionary)
+            routes (list): optional list of dictionaries with a source
+                ("session/name") and a target ("session/name" or list of
+                them)
+        """
+        multi = cls()
+        for name, session in params["sessions"].items():
+            multi.add_session(name, Subscriber.from_dictionary(**session))
+        for route in params.get("routes", []):
+            targets = route["target"]
+            if isinstance(targets, str):
+                targets = [targets]
+            for target in targets:
+                multi.add_route(route["source"], target)
+        return multi
+
+    @classmethod
+    def from_file(cls, parameter_file):
+        """Instantiate the subscriber from a parameter file.
+
+        Arguments
+        parameter_file (str): Name of YAML confiugration file.
+        See from_dictionary for required items in YAML.
+        """
+        return cls.from_dictionary(**yaml_to_dict(parameter_file))
+
+    def add_session(self, name, subscriber):
+        """Add a server session.
+
+        Arguments
+        name (str): Name of the session
+        subscriber (Subscriber): Subscriber of the server
+        """
+        if "/" in name:
+            raise ValueError(f"session name {name!r} must not contain '/'")
+        self._sessions[name] = subscriber
+        subscriber.set_callback(
+            lambda name, value, session=name: self._on_change(
+                session, name, value))
+
+    def add_route(self, source, target):
+        """Forward the value of a node to a node of another session.
+
+        Arguments
+        source (str): "session/name" of the node to forward
+        target (str): "session/name" of the node to write
+        """
+        self._split(source)
+        self._split(target)
+        self._routes.setdefault(source, []).append(target)
+        self._resolved.pop(source.partition("/")[0], None)
+
+    def set_callback(self, callback):
+        """Set the callback to be called on changes in the monitored node
+        values of all sessions.
+
+        Arguments
+        callback (func): Function called with name ("session/name") and
+            value
+        """
+        self._callback = callback
+
+    def _split(self, name):
+        """Split a node name into session and name in the session.
+
+        Arguments
+        name (str): "session/name"
+
+        returns (tuple): (Subscriber, name)
+        """
+        session, _, node = name.partition("/")
+        if session not in self._sessions or not node:
+            raise KeyError(f"{name!r} is not a node of a session "
+                           f"{tuple(self._sessions)}")
+        return self._sessions[session], node
+
+    def _canonical(self, name):
+        """Get the name a session uses in notifications of a node.
+
+        Arguments
+        name (str): "session/name" with any name of the node
+
+        returns (str): "session/name" with the name used in notifications
+        """
+        sub, node = self._split(name)
+        session = name.partition("/")[0]
+        return f"{session}/{sub.canonical_name(node)}"
+
+    def _session_routes(self, session):
+        """Get the routes of a session keyed by the names used in its
+        notifications, resolved on first use (the node names of a session
+        are known once it is subscribed).
+
+        Arguments
+        session (str): Name of the session
+
+        returns (dict): Keys are "session/name" of the sources, values are
+            lists of targets
+        """
+        routes = self._resolved.get(session)
+        if routes is None:
+            routes = dict()
+            for source, targets in self._routes.items():
+                if source.partition("/")[0] != session:
+                    continue
+                try:
+                    routes[self._canonical(source)] = targets
+                except KeyError:
+                    logger.error(f"route source {source!r} is not monitored")
+            self._resolved[session] = routes
+        return routes
+
+    def _on_change(self, session, name, value):
+        """Handle a change of a node value: call the callback and forward
+        the value along the routes. Runs on the dispatcher of the session.
+
+        Arguments
+        session (str): Name of the session
+        name (str): Name of the node in the session
+        value (varies): New value
+        """
+        qualified = f"{session}/{name}"
+        if self._callback is not None:
+            self._callback(name=qualified, value=value)
+        for target in self._session_routes(session).get(qualified, []):
+            try:
+                self.respond(target, value)
+            except Exception:
+                logger.exception(f"forwarding {qualified} to {target} failed")
+
+    def respond(self, node, value):
+        """Write a value to a node.
+
+        Arguments
+        node (str): "session/name" of the node
+        value (varies): value to write
+        """
+        sub, name = self._split(node)
+        if node.partition("/")[0] in self._failed:
+            logger.warning(f"{node} not written, its session is not started")
+            return
+        sub.respond(name, value)
+
+    def respond_many(self, values):
+        """Write values to nodes of several sessions, one Write call per
+        session.
+
+        Arguments
+        values (dict): Keys are "session/name", values are the values to
+            write
+
+        returns (dict): Keys are "session/name", values are the StatusCodes
+            of the writes, BadServerNotConnected for the nodes of sessions
+            that failed to start
+        """
+        groups = dict()
+        results = dict()
+        for node, value in values.items():
+            session = node.partition("/")[0]
+            name = self._split(node)[1]
+            if session in self._failed:
+                results[node] = ua.StatusCode(
+                    ua.StatusCodes.BadServerNotConnected)
+            else:
+                groups.setdefault(session, {})[name] = value
+        for session, group in groups.items():
+            results.update(
+                {f"{session}/{k}": v for k, v in
+                 self._sessions[session].respond_many(group).items()})
+        return results
+
+    def dispatch_stats(self):
+        """Get the callback dispatch statistics of the sessions.
+
+        returns (dict): Keys are session names, values are statistics (see
+            Dispatcher.stats)
+        """
+        return {k: s.dispatch_stats() for k, s in self._sessions.items()
+                if k not in self._failed}
+
+    def recovery_stats(self):
+        """Get the connection recovery statistics of the sessions.
+
+        returns (dict): Keys are session names, values are statistics (see
+            Subscriber.recovery_stats)
+        """
+        return {k: s.recovery_stats() for k, s in self._sessions.items()
+                if k not in self._failed}
+
+    def run(self):
+        """Connect to all servers concurrently and subscribe to the nodes.
+        Sessions that fail to start are logged and dropped.
+        """
+        threads = {name: threading.Thread(target=self._run_session,
+                                          args=(name,), daemon=True)
+                   for name in self._sessions}
+        for thread in threads.values():
+            thread.start()
+        for thread in threads.values():
+            thread.join()
+        logger.info(f"OPC sessions {tuple(self._sessions)} started")
+
+    def _run_session(self, name):
+        """Start the subscriber of a session and resolve its routes.
+
+        Arguments
+        name (str): Name of the session
+        """
+        try:
+            self._sessions[name].run()
+        except Exception:
+            logger.exception(f"session {name} failed to start")
+            self._failed.add(name)
+            return
+        self._session_routes(name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="OPC UA node subscriber of several servers")
+    parser.add_argument(
+        "--parameter_file",
+        help="YAML file defining the sessions and routes",
+        type=str,
+        default="./parameter_file.yml"
+    )
+    parser.add_argument(
+        "--debug_level",
+        help="debugger level (e.g. INFO, WARN, DEBUG, ...)",
+        type=str,
+        default="INFO"
+    )
+    args = parser.parse_args()
+    multi = MultiSubscriber.from_file(args.parameter_file)
+
+    def callback(*args, **kwargs):
+        print(args, kwargs.items())
+    multi.set_callback(callback)
+    multi.run()
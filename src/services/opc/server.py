@@ -5,8 +5,10 @@ Run an OPC UA server.
 """
 import argparse
 import logging
+from datetime import datetime, timedelta
 from opcua import Server, ua
 from lib import helper_functions
+from services.opc.history import SqliteHistory
 from pdb import set_trace
 __author__ = 'Brent Maranzano'
 __license__ = 'MIT'
@@ -20,6 +22,10 @@ class OpcServer(Server):
     class attributes added to opcua.Server:
         _server
         _nodes
+
+    Nodes with a "history" entry in the YAML (true or the retention period
+    (s) and/or count) are historized in an SQLite database (history_file)
+    and answer HistoryRead requests.
     """
 
     def __init__(self, parameters):
@@ -30,6 +36,10 @@ class OpcServer(Server):
         """
         self._params = parameters
         self._nodes = {}  # Define a map between the node name and Node.
+        self._types = {}  # Define a map between the node name and VariantType.
+        self._history = None
+        self._historized = {}  # Define a map between the node name and
+        # history retention.
 
     @classmethod
     def from_parameter_file(cls, parameter_file):
@@ -50,10 +60,31 @@ class OpcServer(Server):
         nodes (dict): Information on node creation
         """
         for name, attr in nodes.items():
-            node = obj.add_variable(idx, name, attr["value"],
-                                    getattr(ua.VariantType, attr["type"]))
+            vtype = getattr(ua.VariantType, attr["type"])
+            node = obj.add_variable(idx, name, attr["value"], vtype)
             node.set_writable() if attr["writable"] else node.set_read_only()
             self._nodes[name] = node
+            self._types[name] = vtype
+            if attr.get("history"):
+                self._historized[name] = attr["history"]
+
+    def _historize(self, node, history):
+        """Store the value changes of a node in the history database.
+
+        Arguments
+        node (Node): Node
+        history (bool or dict): True or the retention, period (s) and/or
+            count (number of values) to keep, all values by default
+        """
+        history = history if isinstance(history, dict) else {}
+        if self._history is None:
+            self._history = SqliteHistory(
+                self._params.get("history_file", "history.db"))
+            self._server.iserver.history_manager.set_storage(self._history)
+        period = history.get("period")
+        self._server.historize_node_data_change(
+            node, timedelta(seconds=period) if period else None,
+            history.get("count", 0))
 
     def get_nodes(self):
         """Return the nodes.
@@ -62,6 +93,27 @@ class OpcServer(Server):
         """
         return self._nodes
 
+    def set_values(self, values, timestamp=None):
+        """Write the values of several nodes in one call.
+
+        Arguments
+        values (dict): Keys are node names, values are the values to write
+        timestamp (datetime): Source timestamp (UTC), defaults to now
+
+        returns (list): StatusCodes of the writes
+        """
+        timestamp = timestamp or datetime.utcnow()
+        params = ua.WriteParameters()
+        for name, value in values.items():
+            wv = ua.WriteValue()
+            wv.NodeId = self._nodes[name].nodeid
+            wv.AttributeId = ua.AttributeIds.Value
+            wv.Value = ua.DataValue(ua.Variant(value, self._types[name]))
+            wv.Value.SourceTimestamp = timestamp
+            wv.Value.ServerTimestamp = timestamp
+            params.NodesToWrite.append(wv)
+        return self._server.iserver.isession.write(params)
+
     def run(self):
         """Instantiate and run server
         """
@@ -74,6 +126,8 @@ class OpcServer(Server):
         obj = self._server.nodes.objects.add_object(idx, params["object"]["name"])
         self._create_nodes(idx, obj, params["object"]["nodes"])
         self._server.start()
+        for name, history in self._historized.items():
+            self._historize(self._nodes[name], history)
 
 
 if __name__ == "__main__":
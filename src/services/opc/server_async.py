@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Run an OPC UA server on the asyncio OPC UA stack (asyncua).
+"""
+import argparse
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from asyncua import Server, ua
+from asyncua.common.structures104 import new_struct, new_struct_field
+from lib import helper_functions
+
+__author__ = "Brent Maranzano"
+__license__ = "MIT"
+
+
+logger = logging.getLogger("services.opc.server_async")
+
+
+class AsyncOpcServer(object):
+    """OPC server with the interface of OpcServer, running the asyncua server
+    on an event loop in a background thread. Values of several nodes are
+    written in one batch with set_values.
+
+    Besides the scalar types of OpcServer, the YAML nodes schema supports
+    arrays (a list as value) and structures:
+        STATUS:
+            type: Structure
+            fields:
+                flowrate: Float
+                running: Boolean
+                history: [Float]  # array field
+            value: {flowrate: 0, running: false, history: []}
+            writable: false
+    The structure data type is named after the node.
+    """
+
+    def __init__(self, parameters):
+        """Create an OPC UA server
+
+        Arguments
+        parameters (dict): Dictionary of server configuration parameters.
+        """
+        self._params = parameters
+        self._nodes = {}  # Define a map between the node name and Node.
+        self._types = {}  # Define a map between the node name and VariantType.
+        self._structs = {}  # Define a map between the node name and class.
+        self._loop = None
+
+    @classmethod
+    def from_parameter_file(cls, parameter_file):
+        """Create an OPC UA server
+
+        Arguments
+        parameter_file (str): Filename for the service parameters.
+        """
+        params = helper_functions.yaml_to_dict(parameter_file)
+        return cls(params)
+
+    async def _create_structs(self, idx, nodes):
+        """Create the data types of the structure nodes.
+
+        Arguments
+        idx (int): Namesapce index
+        nodes (dict): Information on node creation
+        """
+        structs = {n: a for n, a in nodes.items() if a["type"] == "Structure"}
+        for name, attr in structs.items():
+            fields = []
+            for field, ftype in attr["fields"].items():
+                array = isinstance(ftype, list)
+                ftype = ftype[0] if array else ftype
+                fields.append(new_struct_field(
+                    field, getattr(ua.VariantType, ftype), array=array))
+            await new_struct(self._server, idx, name, fields)
+        if structs:
+            await self._server.load_data_type_definitions()
+        for name in structs:
+            self._structs[name] = getattr(ua, name)
+
+    def _variant(self, name, value):
+        """Make the variant of a node value.
+
+        Arguments
+        name (str): Node name
+        value (varies): Value (a dictionary for structures)
+
+        returns (Variant): variant
+        """
+        if name in self._structs:
+            value = self._structs[name](**value)
+        return ua.Variant(value, self._types[name])
+
+    async def _create_nodes(self, idx, obj, nodes):
+        """Create nodes in the namespace and object.
+
+        Arguments
+        idx (int): Namesapce index
+        obj (Node): Object node
+        nodes (dict): Information on node creation
+        """
+        await self._create_structs(idx, nodes)
+        for name, attr in nodes.items():
+            if attr["type"] == "Structure":
+                self._types[name] = ua.VariantType.ExtensionObject
+                datatype = self._structs[name].data_type
+            else:
+                self._types[name] = getattr(ua.VariantType, attr["type"])
+                datatype = None
+            node = await obj.add_variable(
+                idx, name, self._variant(name, attr["value"]),
+                datatype=datatype)
+            if attr["writable"]:
+                await node.set_writable()
+            self._nodes[name] = node
+
+    def get_nodes(self):
+        """Return the nodes.
+
+        return (list): list of dictionary of nodes.
+        """
+        return self._nodes
+
+    async def update(self, values, timestamp=None):
+        """Write the values of several nodes in one Write call.
+
+        Arguments
+        values (dict): Keys are node names, values are the values to write
+        timestamp (datetime): Source timestamp (UTC), defaults to now
+
+        returns (list): StatusCodes of the writes
+        """
+        timestamp = timestamp or datetime.utcnow()
+        params = ua.WriteParameters()
+        for name, value in values.items():
+            params.NodesToWrite.append(ua.WriteValue(
+                NodeId=self._nodes[name].nodeid,
+                AttributeId=ua.AttributeIds.Value,
+                Value=ua.DataValue(self._variant(name, value),
+                                   SourceTimestamp=timestamp,
+                                   ServerTimestamp=timestamp)))
+        return await self._server.iserver.isession.write(params)
+
+    def set_values(self, values, timestamp=None):
+        """Write the values of several nodes in one call (see update), from
+        any thread.
+
+        Arguments
+        values (dict): Keys are node names, values are the values to write
+        timestamp (datetime): Source timestamp (UTC), defaults to now
+
+        returns (list): StatusCodes of the writes
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self.update(values, timestamp), self._loop).result()
+
+    async def _start(self):
+        """Create the nodes and start the server.
+        """
+        params = self._params
+        self._server = Server()
+        await self._server.init()
+        self._server.set_endpoint(params["endpoint"])
+        self._server.set_server_name(params["name"])
+        idx = await self._server.register_namespace(params["uri"])
+        obj = await self._server.nodes.objects.add_object(
+            idx, params["object"]["name"])
+        await self._create_nodes(idx, obj, params["object"]["nodes"])
+        await self._server.start()
+
+    def run(self):
+        """Instantiate and run server, returns once the server is started.
+        """
+        logger.info("starting OPC service")
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+
+    def stop(self):
+        """Stop the server and its event loop.
+        """
+        asyncio.run_coroutine_threadsafe(
+            self._server.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OPC UA server (asyncua)")
+    parser.add_argument(
+        "--parameter_file",
+        help="YAML file defining parameters for server",
+        type=str,
+        default="./parameter_file.yml"
+    )
+    parser.add_argument(
+        "--debug_level",
+        help="debugger level (e.g. INFO, WARN, DEBUG, ...)",
+        type=str,
+        default="INFO"
+    )
+    args = parser.parse_args()
+    server = AsyncOpcServer.from_parameter_file(args.parameter_file)
+    server.run()
+    threading.Event().wait()
@@ -4,8 +4,15 @@
 Class to monitor OPC UA server nodes.
 """
 import argparse
+import json
 import logging
-from opcua import Client
+import os
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from time import monotonic, sleep
+from opcua import Client, ua
 from pdb import set_trace
 from lib.helper_functions import yaml_to_dict
 
@@ -15,23 +22,186 @@ __license__ = "MIT"
 
 logger = logging.getLogger("instrument.opc.client")
 
+# Default monitoring settings of a node. Intervals are in ms, a sampling
+# interval of None samples at the publishing interval. deadband_type is
+# "absolute" or "percent" (of the EURange of the node), a deadband of 0
+# reports every change. A queue size of 0 lets the server choose (1).
+SUBSCRIPTION = {
+    "publishing_interval": 1000,
+    "sampling_interval": None,
+    "deadband": 0.0,
+    "deadband_type": "absolute",
+    "queue_size": 0
+}
+DEADBAND_TYPES = {"absolute": 1, "percent": 2}
+
+
+class Dispatcher(object):
+    """Run notification handlers on a pool of worker threads. Handlers for
+    the same key (e.g. node name) run one at a time in the order they were
+    submitted, handlers for different keys run in parallel, so a slow
+    handler only delays the notifications of its own key. The time
+    notifications wait for a worker and the time handlers take are recorded.
+    """
+
+    def __init__(self, workers=4):
+        """Create the dispatcher.
+
+        Arguments
+        workers (int): Number of worker threads
+        """
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="dispatch")
+        self._pending = dict()  # map between key and deque of notifications
+        self._lock = threading.Lock()
+        self._count = 0
+        self._errors = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._handler_total = 0.0
+        self._handler_max = 0.0
+
+    def submit(self, key, handler, **kwargs):
+        """Queue a call of the handler.
+
+        Arguments
+        key (hashable): Calls with the same key are run in order
+        handler (func): Function to call
+        kwargs: keyword arguments of the call
+        """
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending.append((monotonic(), handler, kwargs))
+                return
+            self._pending[key] = deque([(monotonic(), handler, kwargs)])
+        self._executor.submit(self._drain, key)
+
+    def _drain(self, key):
+        """Run the queued calls of a key until none are left.
+
+        Arguments
+        key (hashable): Key of the calls
+        """
+        while True:
+            with self._lock:
+                pending = self._pending[key]
+                if not pending:
+                    del self._pending[key]
+                    return
+                queued, handler, kwargs = pending.popleft()
+            start = monotonic()
+            try:
+                handler(**kwargs)
+                error = 0
+            except Exception:
+                logger.exception(f"handler of {key} failed")
+                error = 1
+            end = monotonic()
+            with self._lock:
+                self._count += 1
+                self._errors += error
+                self._wait_total += start - queued
+                self._wait_max = max(self._wait_max, start - queued)
+                self._handler_total += end - start
+                self._handler_max = max(self._handler_max, end - start)
+
+    def stats(self):
+        """Get the dispatch statistics.
+
+        returns (dict): pending (number of queued calls), count (number of
+            calls run), errors (number of calls that raised), queue_wait and
+            handler (mean and max time (s) calls waited for a worker and
+            took to run)
+        """
+        with self._lock:
+            count = self._count
+            return {
+                "pending": sum(len(p) for p in self._pending.values()),
+                "count": count,
+                "errors": self._errors,
+                "queue_wait": {
+                    "mean": self._wait_total / count if count else 0.0,
+                    "max": self._wait_max
+                },
+                "handler": {
+                    "mean": self._handler_total / count if count else 0.0,
+                    "max": self._handler_max
+                }
+            }
+
+    def shutdown(self, wait=True):
+        """Stop the workers.
+
+        Arguments
+        wait (bool): Wait for the queued calls to finish
+        """
+        self._executor.shutdown(wait=wait)
+
 
 class Subscriber():
     """Create a subscription service to monitor node value changes. Upon change
-    call a callback function to handle changes. The name representing the nodes
-    must be unique.  That means monitoring identical node names in different
-    parts of the OPC server tree is not permitted.
+    call a callback function to handle changes. A node is named by its short
+    name if that is unique among the monitored nodes, otherwise by
+    "object/name", or by "uri/object/name" if the object name is used in
+    several namespaces. The qualified names are accepted for every node.
+
+    Nodes are monitored with the settings of SUBSCRIPTION, which can be set
+    per node or per group of nodes. One subscription is created for each
+    publishing interval (rate class).
+
+    The callback runs on the workers of a Dispatcher rather than on the
+    thread receiving the notifications. Notifications of a node are handled
+    in order, different nodes are handled in parallel.
+
+    Values written back to the server are sent in one Write call per batch.
+    With a write window, values passed to respond are buffered for the
+    window and written together, the latest value of a node wins.
+
+    The connection is checked every keepalive period. When it is lost, the
+    subscriber reconnects with exponential backoff, recreates the monitored
+    items of the resolved nodes and reads their current values, calling the
+    callback for values that changed while disconnected.
     """
 
-    def __init__(self, endpoint):
+    def __init__(self, endpoint, cache_file=None, batch_size=500, workers=4,
+                 write_window=0.0, keepalive=5.0, max_backoff=30.0):
         """Instantiate an the base class OPC client.
 
         Arguments
         endpoint (str): Server address
+        cache_file (str): JSON file to cache the resolved NodeIds between
+            restarts, None to not cache.
+        batch_size (int): Maximum number of nodes per browse and read call
+        workers (int): Number of threads running the callback
+        write_window (float): Time (s) values passed to respond are buffered
+            before they are written, 0 to write immediately
+        keepalive (float): Period (s) to check the connection
+        max_backoff (float): Longest wait (s) between reconnection attempts
         """
         self._endpoint = endpoint
+        self._cache_file = cache_file
+        self._batch_size = batch_size
         self._monitor = []  # list of tuples that define the nodes (see _get_nodes)
-        self._map = dict()  # map between name and Node object
+        self._settings = dict()  # map between (uri, object, name) and settings
+        self._subscriptions = dict()  # map between publishing interval and
+        # Subscription
+        self._dispatcher = Dispatcher(workers)
+        self._write_window = write_window
+        self._write_buffer = dict()  # map between name and (value, timestamp)
+        self._write_lock = threading.Lock()
+        self._write_timer = None
+        self._keepalive = keepalive
+        self._max_backoff = max_backoff
+        self._lost = threading.Event()  # set when the connection is lost
+        self._values = dict()  # map between name and last notified value
+        self._resync = set()  # names whose first notification is a resend
+        self._recovery = {"connected": False, "recoveries": 0,
+                          "last_recovery": 0.0, "total_downtime": 0.0,
+                          "missed": 0}
+        self._nodes = dict()  # map between (uri, object, name) and Node
+        self._map = dict()  # map between names (and qualified names) and Node
+        self._names = dict()  # map between NodeId and name
 
     @classmethod
     def from_dictionary(cls, **params):
@@ -42,12 +212,35 @@ class Subscriber():
             The dictionary should contain:
             endpoint (str): OPC server address
             uri (str): the namespace for the nodes
-            obj (str): the parent object node of the nodes
-            nodes (list): list of node names to subscribe
+            object (dict): the parent object of the nodes
+                name (str): name of the object
+                nodes (list or dict): node names to subscribe, or a map
+                    between node names and their monitoring settings
+                subscription (dict): optional monitoring settings of the
+                    nodes of the object
+            or instead of object
+            objects (list): list of objects (name, nodes and optionally uri
+                if not in the default namespace and subscription)
+            subscription (dict): optional default monitoring settings (see
+                SUBSCRIPTION)
+            cache_file (str): optional file to cache resolved NodeIds
+            workers (int): optional number of threads running the callback
+            write_window (float): optional time (s) to buffer written values
+            keepalive (float): optional period (s) to check the connection
+            max_backoff (float): optional longest wait (s) between
+                reconnection attempts
         """
-        sub = cls(endpoint=params["endpoint"])
-        sub._monitor = [(params["uri"], params["object"]["name"],
-                         params["object"]["nodes"])]
+        sub = cls(endpoint=params["endpoint"],
+                  cache_file=params.get("cache_file"),
+                  workers=params.get("workers", 4),
+                  write_window=params.get("write_window", 0.0),
+                  keepalive=params.get("keepalive", 5.0),
+                  max_backoff=params.get("max_backoff", 30.0))
+        for obj in params.get("objects", [params.get("object")]):
+            settings = dict(params.get("subscription") or {})
+            settings.update(obj.get("subscription") or {})
+            sub.add_nodes(obj.get("uri", params.get("uri")), obj["name"],
+                          obj["nodes"], settings)
         return sub
 
     @classmethod
@@ -80,30 +273,150 @@ class Subscriber():
         """
         self._callback = callback
 
-    def add_nodes(self, uri, obj, nodes):
+    def add_nodes(self, uri, obj, nodes, settings=None):
         """Add nodes to the subscription.
 
         Arguments
         uri (str): the namespace for the nodes
         obj (str): the parent object node of the nodes
-        nodes (list): list of node names to subscribe
+        nodes (list or dict): node names to subscribe, or a map between node
+            names and their monitoring settings (None for the group settings)
+        settings (dict): monitoring settings of the group (see SUBSCRIPTION)
         """
-        self._monitor.append((uri, obj, nodes))
+        if not isinstance(nodes, dict):
+            nodes = dict.fromkeys(nodes)
+        for name, node_settings in nodes.items():
+            merged = dict(SUBSCRIPTION)
+            merged.update(settings or {})
+            merged.update(node_settings or {})
+            if merged["deadband_type"] not in DEADBAND_TYPES:
+                raise ValueError(f"deadband_type of {name} must be one of "
+                                 f"{tuple(DEADBAND_TYPES)}")
+            self._settings[(uri, obj, name)] = merged
+        self._monitor.append((uri, obj, list(nodes)))
+
+    def _get_nodes(self, keys):
+        """Get links to the OPC nodes. NodeIds from the cache file are
+        verified with a bulk read of their browse names, the remaining nodes
+        are resolved with batched TranslateBrowsePathsToNodeIds calls.
 
-    def _get_nodes(self, uri, obj, names):
-        """Get links to the OPC nodes.
+        Arguments
+        keys (list): List of tuples (uri, object name, node name)
+
+        returns (dict): Keys are the tuples, values are Nodes
+        """
+        index = {uri: self._client.get_namespace_index(uri)
+                 for uri, _, _ in keys}
+        cache = self._load_cache()
+        cached = {}
+        for uri, obj, name in keys:
+            nodeid = cache.get(uri, {}).get(f"{obj}/{name}")
+            if nodeid is not None:
+                nodeid = ua.NodeId.from_string(nodeid)
+                nodeid.NamespaceIndex = index[uri]
+                cached[(uri, obj, name)] = nodeid
+        nodeids = self._verify(cached, index)
+        missing = [k for k in keys if k not in nodeids]
+        if missing:
+            logger.info(f"resolving {len(missing)} of {len(keys)} nodes")
+            nodeids.update(self._translate(missing, index))
+            for uri, obj, name in missing:
+                cache.setdefault(uri, {})[f"{obj}/{name}"] = \
+                    nodeids[(uri, obj, name)].to_string()
+            self._save_cache(cache)
+        return {k: self._client.get_node(nodeids[k]) for k in keys}
+
+    def _batches(self, items):
+        """Split a list into batches of the batch size.
 
         Arguments
-        uri (str): Namespace
-        obj (str): Object name
-        names (list): List of string of node names
+        items (list): Items
+
+        returns (generator): Lists of at most batch size items
+        """
+        for i in range(0, len(items), self._batch_size):
+            yield items[i:i + self._batch_size]
+
+    def _translate(self, keys, index):
+        """Resolve browse paths to NodeIds.
+
+        Arguments
+        keys (list): List of tuples (uri, object name, node name)
+        index (dict): Map between namespace uri and index
 
-        returns (list): List of Nodes
+        returns (dict): Keys are the tuples, values are NodeIds
         """
-        idx = self._client.get_namespace_index(uri)
         root = self._client.get_root_node()
-        nodes = [root.get_child(self._get_path(idx, obj, n)) for n in names]
-        return nodes
+        nodeids = {}
+        for batch in self._batches(keys):
+            paths = []
+            for uri, obj, name in batch:
+                path = ua.BrowsePath()
+                path.StartingNode = root.nodeid
+                path.RelativePath = root._make_relative_path(
+                    self._get_path(index[uri], obj, name))
+                paths.append(path)
+            results = self._client.uaclient.translate_browsepaths_to_nodeids(
+                paths)
+            for key, result in zip(batch, results):
+                result.StatusCode.check()
+                nodeids[key] = result.Targets[0].TargetId
+        return nodeids
+
+    def _verify(self, nodeids, index):
+        """Check cached NodeIds against the server by reading their browse
+        names.
+
+        Arguments
+        nodeids (dict): Keys are tuples (uri, object name, node name),
+            values are NodeIds
+        index (dict): Map between namespace uri and index
+
+        returns (dict): The NodeIds whose browse name matches
+        """
+        valid = {}
+        for batch in self._batches(list(nodeids)):
+            params = ua.ReadParameters()
+            for key in batch:
+                rv = ua.ReadValueId()
+                rv.NodeId = nodeids[key]
+                rv.AttributeId = ua.AttributeIds.BrowseName
+                params.NodesToRead.append(rv)
+            for (uri, obj, name), dv in zip(batch,
+                                            self._client.uaclient.read(params)):
+                if (dv.StatusCode.is_good() and dv.Value.Value
+                        == ua.QualifiedName(name, index[uri])):
+                    valid[(uri, obj, name)] = nodeids[(uri, obj, name)]
+        if len(valid) < len(nodeids):
+            logger.info(f"{len(nodeids) - len(valid)} cached nodes are stale")
+        return valid
+
+    def _load_cache(self):
+        """Load the NodeIds cached for the endpoint.
+
+        returns (dict): Keys are namespace uris, values are maps between
+            "object/name" and NodeId strings.
+        """
+        if self._cache_file is None or not os.path.exists(self._cache_file):
+            return {}
+        with open(self._cache_file, "rt") as file_obj:
+            return json.load(file_obj).get(self._endpoint, {})
+
+    def _save_cache(self, cache):
+        """Save the NodeIds cached for the endpoint.
+
+        Arguments
+        cache (dict): see _load_cache
+        """
+        if self._cache_file is None:
+            return
+        data = {}
+        if os.path.exists(self._cache_file):
+            with open(self._cache_file, "rt") as file_obj:
+                data = json.load(file_obj)
+        data[self._endpoint] = cache
+        with open(self._cache_file, "wt") as file_obj:
+            json.dump(data, file_obj, indent=2)
 
     def _get_path(self, idx, obj, name):
         """Make a browse path list from the namespace index and object and
@@ -119,6 +432,24 @@ class Subscriber():
         bp = ["0:Objects", f"{idx}:{obj}", f"{idx}:{name}"]
         return bp
 
+    def _build_index(self):
+        """Name the monitored nodes and build the maps between names and
+        nodes (self._map) and from NodeId to name (self._names).
+        """
+        names = Counter(name for _, _, name in self._nodes)
+        paths = Counter((obj, name) for _, obj, name in self._nodes)
+        self._map = dict()
+        self._names = dict()
+        for (uri, obj, name), node in self._nodes.items():
+            qualified = [f"{uri}/{obj}/{name}"]
+            if paths[(obj, name)] == 1:
+                qualified.append(f"{obj}/{name}")
+            if names[name] == 1:
+                qualified.append(name)
+            self._map.update({k: node for k in qualified})
+            key = qualified[-1]
+            self._names[node.nodeid] = key
+
     def _get_name(self, node):
         """
         Get the name of the node from the mapping.
@@ -128,35 +459,258 @@ class Subscriber():
 
         return (str) name associated with node
         """
-        return [k for k, v in self._map.items() if v == node][0]
+        return self._names[node.nodeid]
+
+    def canonical_name(self, name):
+        """Get the name used in the notifications of a node.
+
+        Arguments
+        name (str): Any name of the node (see self._map)
+
+        returns (str): Name passed to the callback for the node
+        """
+        return self._names[self._map[name].nodeid]
 
     def respond(self, node, value):
-        """Write a value to the node.
+        """Write a value to the node, or buffer it if a write window is set.
 
         Arguments
         node (str): String associated with node (see self._map)
         value (varries): value to write
         """
-        self._map[node].set_value(value)
+        if self._write_window <= 0:
+            self._write({node: (value, datetime.utcnow())})[node].check()
+            return
+        with self._write_lock:
+            self._write_buffer[node] = (value, datetime.utcnow())
+            if self._write_timer is None:
+                self._write_timer = threading.Timer(self._write_window,
+                                                    self.flush)
+                self._write_timer.daemon = True
+                self._write_timer.start()
+
+    def flush(self):
+        """Write the buffered values.
+
+        returns (dict): Keys are names, values are the StatusCodes of the
+            writes
+        """
+        with self._write_lock:
+            values, self._write_buffer = self._write_buffer, dict()
+            self._write_timer = None
+        return self._write(values) if values else dict()
+
+    def respond_many(self, values):
+        """Write values to several nodes in a single Write call.
+
+        Arguments
+        values (dict): Keys are names (see self._map), values are the values
+            to write
+
+        returns (dict): Keys are names, values are the StatusCodes of the
+            writes
+        """
+        now = datetime.utcnow()
+        return self._write({k: (v, now) for k, v in values.items()})
+
+    def _write(self, values):
+        """Write values with their source timestamps.
+
+        Arguments
+        values (dict): Keys are names, values are tuples (value, timestamp)
+
+        returns (dict): Keys are names, values are the StatusCodes of the
+            writes
+        """
+        results = dict()
+        for batch in self._batches(list(values)):
+            params = ua.WriteParameters()
+            for name in batch:
+                value, timestamp = values[name]
+                wv = ua.WriteValue()
+                wv.NodeId = self._map[name].nodeid
+                wv.AttributeId = ua.AttributeIds.Value
+                wv.Value = ua.DataValue(ua.Variant(value))
+                wv.Value.SourceTimestamp = timestamp
+                params.NodesToWrite.append(wv)
+            results.update(zip(batch, self._client.uaclient.write(params)))
+        for name, result in results.items():
+            if not result.is_good():
+                logger.error(f"writing {name} failed: {result}")
+        return results
 
     def datachange_notification(self, node, val, data):
         """This method is called on subscribed node changes.
         see https://python-opcua.readthedocs.io/en/latest/subscription.html
         """
         name = self._get_name(node)
-        self._callback(name=name, value=val)
+        if name in self._resync:
+            self._resync.discard(name)
+            if self._values.get(name) == val:
+                return
+        self._values[name] = val
+        self._dispatcher.submit(name, self._callback, name=name, value=val)
+
+    def status_change_notification(self, status):
+        """This method is called on a status change of a subscription (e.g.
+        the subscription timed out on the server).
+        """
+        logger.warning(f"subscription status changed: {status}")
+        self._lost.set()
+
+    def dispatch_stats(self):
+        """Get the statistics of the callback dispatch (see
+        Dispatcher.stats).
+
+        returns (dict): statistics
+        """
+        return self._dispatcher.stats()
 
     def run(self):
-        """Connect to client, and subscribe to nodes.
+        """Connect to client, subscribe to nodes and start monitoring the
+        connection.
         """
         self._connect(self._endpoint)
-        for s in self._monitor:
-            nodes = self._get_nodes(s[0], s[1], s[2])
-            self._map.update({k: v for k, v in zip(s[2], nodes)})
-        nodes = [v for k, v in self._map.items()]
-        sub = self._client.create_subscription(1000, self)
-        handle = sub.subscribe_data_change(nodes)
-        logger.info("OPC subscription started")
+        self._nodes = self._get_nodes(
+            [(uri, obj, n) for uri, obj, names in self._monitor for n in names])
+        self._build_index()
+        self._subscribe()
+        self._recovery["connected"] = True
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def _subscribe(self):
+        """Create one subscription per publishing interval and the monitored
+        items of the nodes.
+        """
+        classes = dict()
+        for key in self._nodes:
+            interval = self._settings[key]["publishing_interval"]
+            classes.setdefault(interval, []).append(key)
+        self._subscriptions = dict()
+        for interval, keys in sorted(classes.items()):
+            sub = self._client.create_subscription(interval, self)
+            for batch in self._batches(keys):
+                results = sub.create_monitored_items(
+                    [self._monitored_item(sub, key) for key in batch])
+                for key, result in zip(batch, results):
+                    if isinstance(result, ua.StatusCode):
+                        logger.error(f"monitoring {key} failed: {result}")
+            self._subscriptions[interval] = sub
+            logger.info(f"OPC subscription of {len(keys)} nodes at "
+                        f"{interval} ms started")
+
+    def _watch(self):
+        """Check the connection every keepalive period (or when a
+        subscription reports a status change) and recover when it is lost.
+        """
+        state = ua.NodeId(ua.ObjectIds.Server_ServerStatus_State)
+        while True:
+            self._lost.wait(self._keepalive)
+            try:
+                if self._lost.is_set():
+                    raise ConnectionError("subscription status changed")
+                self._client.get_node(state).get_value()
+            except Exception as error:
+                logger.warning(f"connection to {self._endpoint} lost: "
+                               f"{error!r}")
+                self._recover()
+
+    def _recover(self):
+        """Reconnect with exponential backoff, recreate the monitored items
+        and bring the values up to date with a bulk read.
+        """
+        lost = monotonic()
+        self._recovery["connected"] = False
+        backoff = min(1.0, self._max_backoff)
+        while True:
+            try:
+                self._client.disconnect()
+            except Exception:
+                pass
+            try:
+                self._connect(self._endpoint)
+                self._nodes = {k: self._client.get_node(n.nodeid)
+                               for k, n in self._nodes.items()}
+                self._build_index()
+                self._resync = set(self._names.values())
+                self._lost.clear()
+                missed = self._read_current()
+                self._subscribe()
+                break
+            except Exception as error:
+                logger.warning(f"reconnection to {self._endpoint} failed: "
+                               f"{error!r}, retry in {backoff} s")
+                sleep(backoff)
+                backoff = min(2 * backoff, self._max_backoff)
+        downtime = monotonic() - lost
+        self._recovery.update(
+            connected=True, recoveries=self._recovery["recoveries"] + 1,
+            last_recovery=downtime,
+            total_downtime=self._recovery["total_downtime"] + downtime,
+            missed=self._recovery["missed"] + missed)
+        logger.info(f"reconnected to {self._endpoint} after {downtime:.1f} s, "
+                    f"{missed} values changed while disconnected")
+
+    def _read_current(self):
+        """Read the current values of the nodes and call the callback for
+        the values that differ from the last notified ones.
+
+        returns (int): Number of values that changed
+        """
+        names = list(self._names.items())
+        missed = 0
+        for batch in self._batches(names):
+            params = ua.ReadParameters()
+            for nodeid, _ in batch:
+                rv = ua.ReadValueId()
+                rv.NodeId = nodeid
+                rv.AttributeId = ua.AttributeIds.Value
+                params.NodesToRead.append(rv)
+            for (nodeid, name), dv in zip(batch,
+                                          self._client.uaclient.read(params)):
+                value = dv.Value.Value
+                if not dv.StatusCode.is_good() or (
+                        name in self._values and self._values[name] == value):
+                    continue
+                missed += 1
+                self._values[name] = value
+                self._dispatcher.submit(name, self._callback, name=name,
+                                        value=value)
+        return missed
+
+    def recovery_stats(self):
+        """Get the connection recovery statistics.
+
+        returns (dict): connected (bool), recoveries (number of
+            reconnections), last_recovery and total_downtime (time (s) from
+            detecting the loss to recovery), missed (number of values that changed while
+            disconnected)
+        """
+        return dict(self._recovery)
+
+    def _monitored_item(self, sub, key):
+        """Create the request to monitor a node with its settings.
+
+        Arguments
+        sub (Subscription): Subscription of the rate class of the node
+        key (tuple): (uri, object name, node name)
+
+        returns (MonitoredItemCreateRequest): request
+        """
+        settings = self._settings[key]
+        mfilter = None
+        if settings["deadband"]:
+            mfilter = ua.DataChangeFilter()
+            mfilter.Trigger = ua.DataChangeTrigger.StatusValue
+            mfilter.DeadbandType = DEADBAND_TYPES[settings["deadband_type"]]
+            mfilter.DeadbandValue = float(settings["deadband"])
+        item = sub._make_monitored_item_request(
+            self._nodes[key], ua.AttributeIds.Value, mfilter,
+            settings["queue_size"])
+        if settings["sampling_interval"] is not None:
+            item.RequestedParameters.SamplingInterval = \
+                settings["sampling_interval"]
+        return item
 
 
 if __name__ == "__main__":
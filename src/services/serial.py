@@ -9,7 +9,10 @@ import queue
 import threading
 import logging
 import inspect
+import re
+from functools import partial
 from time import sleep
+from instruments.cache import Cache
 from lib import helper_functions
 from services.opc.subscriber import Subscriber
 
@@ -21,6 +24,23 @@ __license__ = "MIT"
 logger = logging.getLogger("instrument")
 
 
+def _frame(command):
+    """Decode a command frame of the configuration file (e.g.
+    f"3H{chr(13)}") without evaluating it.
+
+    Arguments
+    command (str): Frame, optionally quoted (as a Python string or f-string)
+        with {chr(n)} for control characters
+
+    returns (bytes): Frame to write
+    """
+    match = re.fullmatch(r"""f?(["'])(.*)\1""", command, re.DOTALL)
+    if match:
+        command = match.group(2)
+    return re.sub(r"\{chr\((\d+)\)\}", lambda m: chr(int(m.group(1))),
+                  command).encode("ascii")
+
+
 class Instrument(object):
     """Abastract instrument interface that services command requests generated
     by clients connected by various protocols (e.g. MQTT, HTTP, OPC UA).
@@ -40,6 +60,12 @@ class Instrument(object):
         """
         self._params = self._get_parameters(config_file)
         self._queue = queue.Queue()
+        self._polling = set()  # polled commands queued or being processed
+        self._transport = None
+        self._cache = Cache(self._params.get("poll", {}).get("ttl", 0.0))
+        self._terminators = tuple(
+            t.encode("ascii") for t in self._params.get("terminators", [])
+        ) or None
         self._user = None
         self._password = None
         self._commands = None
@@ -65,9 +91,40 @@ class Instrument(object):
     def _update_data(self):
         """Periodically get the current instrument data and store
         in class attribute to expedite responses to service requests.
-        Method is to be over-ridden.
+        The commands to poll are listed in the "poll" section of the
+        configuration file:
+            poll:
+              interval (float): Polling period (s)
+              ttl (float): Time (s) a polled response is served
+              commands (list): Commands to poll
+        A command is not queued again while its previous poll is pending
+        (e.g. on a slow or hung instrument), so polls cannot pile up ahead
+        of the control commands.
         """
-        pass
+        poll = self._params.get("poll")
+        if poll is None:
+            return
+        logger.info("starting thread to update data")
+        while True:
+            for command in poll["commands"]:
+                if command in self._polling:
+                    continue
+                self._polling.add(command)
+                self._queue.put(dict(
+                    command=command, parameters=None, poll=True,
+                    callback=partial(self._cache.update, command)))
+            sleep(poll["interval"])
+
+    def _telemetry(self):
+        """Get the polled responses to publish over MQTT. The "telemetry"
+        map of the "mqtt" section names the polled commands to publish.
+
+        returns (dict): Keys are telemetry names, values are Readings.
+        """
+        readings = self._cache.snapshot()
+        return {name: readings[command]
+                for name, command in self._mqtt_telemetry.items()
+                if command in readings}
 
     def _process_queue(self):
         """Pop a request off of the queue and process the request.
@@ -75,8 +132,13 @@ class Instrument(object):
         logger.info("process queue thread starting")
         while True:
             request = self._queue.get()
-            self._process_request(request)
-            sleep(0.3)
+            try:
+                self._process_request(request)
+            except Exception:
+                logger.exception(f"{request['command']!r} failed")
+            finally:
+                if request.get("poll"):
+                    self._polling.discard(request["command"])
 
     def _process_request(self, request):
         """Proces the reqest. Note that the command may be blocking.
@@ -88,7 +150,9 @@ class Instrument(object):
            callback (fun): function to call back with command results.
         """
         response = False
-        command = getattr(self, request["command"], False)
+        name = request["command"]
+        # only public methods can be requested, other commands are frames
+        command = not name.startswith("_") and getattr(self, name, False)
         if command:
             # Some services (e.g. OPC) always pass arguments,
             # so check if the method requires one.
@@ -98,12 +162,11 @@ class Instrument(object):
                 response = command(request["parameters"])
         else:
             try:
-                command = eval(request["command"]).encode('ascii')
-                self._serial.write(command)
-                sleep(0.3)
-                response = self._serial.readline()
+                command = _frame(request["command"])
+                response = self._transport.transact(command,
+                                                    self._terminators)
             except Exception:
-                logger.error("Error writing serial command {}".format(command))
+                logger.error("Error writing serial command {}".format(name))
 
         if response:
             request["callback"](response)
@@ -116,7 +179,12 @@ class Instrument(object):
            command (str): Name of command to execute
            parameters (command dependent): Parameters for command.
            callback (fun): function to call back with command results.
+        Commands with a fresh polled response are answered from the cache.
         """
+        reading = self._cache.get(request["command"])
+        if reading is not None:
+            request["callback"](reading.value)
+            return
         self._queue.put(request)
 
     def _start_services(self):
@@ -133,7 +201,12 @@ class Instrument(object):
             )
             self._opc_sub.run()
         if "mqtt" in self._params:
+            # paho-mqtt is only required by instruments using MQTT
+            from services.mqtt.client import MqttClient
+            mqtt = dict(self._params["mqtt"])
+            self._mqtt_telemetry = mqtt.pop("telemetry", {})
             self._mqtt_client = MqttClient.run(
                 callback=self._queue_request,
-                **self._params["mqtt"]
+                telemetry=self._telemetry,
+                **mqtt
             )
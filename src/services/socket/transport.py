@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Response framed transactions over persistent TCP connections.
+"""
+import logging
+import select
+import socket
+import threading
+from time import monotonic, sleep
+
+
+__author__ = "Brent Maranzano"
+__license__ = "MIT"
+
+
+logger = logging.getLogger("instrument.socket")
+
+
+class SocketTransport(object):
+    """Write commands to a LAN attached device (or serial device server) and
+    read the replies until a protocol terminator arrives, with the interface
+    of SerialTransport. The TCP connection is kept open between transactions
+    with TCP keepalive enabled.
+
+    A lost connection is reopened with backoff. A command that could not be
+    sent is retried on the new connection, a command whose reply was lost
+    fails with ConnectionError (the device may have executed it). Requests
+    still queued by the instrument are sent on the new connection.
+
+    Several commands can be pipelined: they are written at once and the
+    replies are split by their terminators in order.
+    """
+
+    def __init__(self, host, port, timeout=0.5, min_interval=0.0,
+                 connect_timeout=2.0, retries=3, backoff=0.5,
+                 keepalive_idle=10):
+        """Create the transport, the connection is opened on first use.
+
+        Arguments
+        host (str): Device address
+        port (int): Device TCP port
+        timeout (float): Default time (s) to wait for a complete reply
+        min_interval (float): Minimum gap (s) between the end of one
+            transaction and the start of the next
+        connect_timeout (float): Time (s) to wait for a connection
+        retries (int): Attempts to open a connection per transaction
+        backoff (float): Wait (s) before the first reconnection attempt,
+            doubled on each further attempt
+        keepalive_idle (int): Idle time (s) before TCP keepalive probes
+        """
+        self._address = (host, port)
+        self._timeout = timeout
+        self._min_interval = min_interval
+        self._connect_timeout = connect_timeout
+        self._retries = retries
+        self._backoff = backoff
+        self._keepalive_idle = keepalive_idle
+        self._sock = None
+        self._buffer = b""
+        self._last = 0.0
+        self._lock = threading.Lock()
+        self.reconnects = 0
+
+    def _connect(self):
+        """Open the connection, retrying with backoff.
+        """
+        backoff = self._backoff
+        for attempt in range(self._retries):
+            try:
+                sock = socket.create_connection(self._address,
+                                                self._connect_timeout)
+                break
+            except OSError as error:
+                logger.warning(f"connecting to {self._address} failed: "
+                               f"{error!r}")
+                if attempt == self._retries - 1:
+                    raise ConnectionError(
+                        f"cannot connect to {self._address}") from error
+                sleep(backoff)
+                backoff *= 2
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE,
+                            self._keepalive_idle)
+        self._sock = sock
+        self._buffer = b""
+        logger.info(f"connected to {self._address}")
+
+    def _drop(self):
+        """Close a broken connection, it is reopened by the next
+        transaction.
+        """
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            self.reconnects += 1
+
+    def close(self):
+        """Close the connection.
+        """
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+
+    def _flush_input(self):
+        """Discard stale bytes (e.g. a late reply) and detect a connection
+        the device closed while idle.
+        """
+        self._buffer = b""
+        while self._sock is not None:
+            readable, _, _ = select.select([self._sock], [], [], 0)
+            if not readable:
+                return
+            try:
+                data = self._sock.recv(4096)
+            except OSError:
+                data = b""
+            if not data:
+                logger.info(f"connection to {self._address} was closed")
+                self._drop()
+
+    def _send(self, data):
+        """Send data, reconnecting once if the connection was lost while
+        idle.
+
+        Arguments
+        data (bytes): Data to send
+        """
+        for attempt in range(2):
+            self._flush_input()
+            if self._sock is None:
+                self._connect()
+            try:
+                self._sock.sendall(data)
+                return
+            except OSError:
+                self._drop()
+                if attempt:
+                    raise
+
+    def transact(self, command, terminators=None, timeout=None):
+        """Write a command and read the reply.
+
+        Arguments
+        command (bytes): Command frame to write
+        terminators (tuple): Byte strings that end a reply. If None the
+            command is written and no reply is read.
+        timeout (float): Time (s) to wait for the reply, defaults to the
+            transport timeout.
+
+        returns (bytes): Reply including the terminator, or None
+        """
+        return self.pipeline([(command, terminators)], timeout)[0]
+
+    def pipeline(self, requests, timeout=None):
+        """Write several commands at once and read their replies in order.
+
+        Arguments
+        requests (list): Tuples (command, terminators), see transact
+        timeout (float): Time (s) to wait for each reply, defaults to the
+            transport timeout.
+
+        returns (list): Replies (bytes or None)
+        """
+        timeout = self._timeout if timeout is None else timeout
+        with self._lock:
+            wait = self._min_interval - (monotonic() - self._last)
+            if wait > 0:
+                sleep(wait)
+            try:
+                self._send(b"".join(command for command, _ in requests))
+                return [None if terminators is None else
+                        self._read_until(command, terminators, timeout)
+                        for command, terminators in requests]
+            except TimeoutError:
+                raise
+            except OSError as error:
+                self._drop()
+                raise ConnectionError(
+                    f"connection to {self._address} lost: {error!r}") \
+                    from error
+            finally:
+                self._last = monotonic()
+
+    def _read_until(self, command, terminators, timeout):
+        """Read from the connection until a terminator arrives. Bytes after
+        the terminator are kept for the next reply (pipelining).
+
+        Arguments
+        command (bytes): Command that was written (for error reporting)
+        terminators (tuple): Byte strings that end a reply
+        timeout (float): Time (s) to wait for the reply
+
+        returns (bytes): Reply up to and including the first terminator
+        """
+        deadline = monotonic() + timeout
+        while True:
+            ends = [self._buffer.find(t) + len(t) for t in terminators
+                    if t in self._buffer]
+            if ends:
+                reply = self._buffer[:min(ends)]
+                self._buffer = self._buffer[min(ends):]
+                return reply
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                logger.warning(f"timeout waiting for reply to {command!r}, "
+                               f"received {self._buffer!r}")
+                self._buffer = b""
+                raise TimeoutError(
+                    f"no reply to {command!r} within {timeout} s")
+            self._sock.settimeout(remaining)
+            try:
+                data = self._sock.recv(4096)
+            except socket.timeout:
+                continue
+            if not data:
+                raise ConnectionError("connection closed by the device")
+            self._buffer += data
+
+
+class SocketPool(object):
+    """Persistent connections shared by the instruments of a process. The
+    instruments attached to the same device address share its connections,
+    so no connection is opened per request or per instrument. A connection
+    is closed when the last instrument using it releases it.
+    """
+
+    _transports = dict()  # map between (host, port) and list of transports
+    _next = dict()  # map between (host, port) and next transport index
+    _users = dict()  # map between transport and number of users
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, host, port, size=1, **params):
+        """Get a pooled transport of a device address.
+
+        Arguments
+        host (str): Device address
+        port (int): Device TCP port
+        size (int): Number of connections to the address (for devices
+            serving several sessions), handed out round robin
+        params: Parameters of new transports (see SocketTransport)
+
+        returns (SocketTransport): transport
+        """
+        key = (host, int(port))
+        with cls._lock:
+            transports = cls._transports.setdefault(key, [])
+            if len(transports) < size:
+                transports.append(SocketTransport(host, int(port), **params))
+                transport = transports[-1]
+            else:
+                index = cls._next.get(key, 0) % len(transports)
+                cls._next[key] = index + 1
+                transport = transports[index]
+            cls._users[transport] = cls._users.get(transport, 0) + 1
+            return transport
+
+    @classmethod
+    def release(cls, transport):
+        """Release a transport got from the pool, the connection is closed
+        and removed from the pool once it has no users.
+
+        Arguments
+        transport (SocketTransport): transport
+        """
+        with cls._lock:
+            users = cls._users.get(transport, 0) - 1
+            if users > 0:
+                cls._users[transport] = users
+                return
+            cls._users.pop(transport, None)
+            for key, transports in list(cls._transports.items()):
+                if transport in transports:
+                    transports.remove(transport)
+                    if not transports:
+                        del cls._transports[key]
+        transport.close()
+
+    @classmethod
+    def close_all(cls):
+        """Close all pooled connections.
+        """
+        with cls._lock:
+            for transports in cls._transports.values():
+                for transport in transports:
+                    transport.close()
+            cls._transports.clear()
+            cls._next.clear()
+            cls._users.clear()
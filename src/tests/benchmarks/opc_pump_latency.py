@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure the latency from a controller node change to the pump command.
+"""
+import argparse
+import json
+import logging
+from multiprocessing import Pipe, Process
+from time import monotonic, sleep
+from instruments.ismatec.ismatec import Ismatec
+from lib import helper_functions
+from project import ismatec_deltav
+from services.opc.server import OpcServer
+from services.opc.subscriber import Subscriber
+from tests.benchmarks.serial_benchmark import percentiles
+from tests.emulators.emulators import IsmatecEmulator
+
+__author__ = 'Brent Maranzano'
+__license__ = 'MIT'
+
+
+logger = logging.getLogger("instrument.benchmarks.opc_pump_latency")
+
+NODE = "SET_FLOWRATE_CONTROLLER"
+# stages of a change in the order they are stamped
+STAGES = ("written", "notified", "dispatched", "dequeued", "device",
+          "acknowledged")
+
+
+def control(params, conn):
+    """Run the controller OPC server and write the node changes requested
+    over a pipe. Runs in its own process, like the controller.
+
+    Each change writes the next sequence number as set point, so the
+    change can be followed to the pump command. The write times are
+    returned as monotonic clock readings, which are comparable between
+    processes on Linux.
+
+    Arguments
+    params (dict): Server parameters
+    conn (Connection): Pipe receiving (rate, duration, first sequence
+        number), answered with a list of (sequence number, write time)
+    """
+    server = OpcServer(params)
+    server.run()
+    node = server.get_nodes()[NODE]
+    conn.send("ready")
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        rate, duration, seq = request
+        written = []
+        start = monotonic()
+        next_change = start
+        while monotonic() - start < duration:
+            written.append((seq, monotonic()))
+            node.set_value(float(seq))
+            seq += 1
+            next_change += 1 / rate
+            sleep(max(0.0, next_change - monotonic()))
+        conn.send(written)
+    server._server.stop()
+
+
+class Stamps(object):
+    """Times (monotonic clock) each change reached the stages of the path,
+    taken by wrapping the subscriber, the callback, the pump and the
+    emulated device.
+    """
+
+    def __init__(self):
+        self.times = {stage: dict() for stage in STAGES}
+
+    def stamp(self, stage, seq):
+        """Record the first time a change reached a stage.
+
+        Arguments
+        stage (str): Stage (see STAGES)
+        seq (float): Sequence number of the change
+        """
+        self.times[stage].setdefault(int(seq), monotonic())
+
+    def wrap_subscriber(self, sub):
+        """Stamp the notifications received by a subscriber.
+        """
+        notify = sub.datachange_notification
+
+        def notified(node, val, data):
+            if sub._get_name(node) == NODE:
+                self.stamp("notified", val)
+            notify(node, val, data)
+        sub.datachange_notification = notified
+
+    def wrap_callback(self, callback):
+        """Stamp the calls of a subscriber callback.
+
+        returns (func): Callback to set on the subscriber
+        """
+        def dispatched(name, value):
+            if name == NODE:
+                self.stamp("dispatched", value)
+            callback(name=name, value=value)
+        return dispatched
+
+    def wrap_pump(self, pump):
+        """Stamp the requests of a pump when they leave its queue and when
+        they are acknowledged.
+        """
+        execute = pump._execute
+
+        def timed(request):
+            seq = request.get("flowrate")
+            if seq is not None:
+                self.stamp("dequeued", seq)
+            execute(request)
+            if seq is not None:
+                self.stamp("acknowledged", seq)
+        pump._execute = timed
+
+    def wrap_device(self, emulator):
+        """Stamp the set point commands received by an emulated pump.
+        """
+        reply = emulator.reply
+
+        def received(frame):
+            if frame[1:2] == b"S" and frame[2:].isdigit():
+                self.stamp("device", int(frame[2:]))
+            return reply(frame)
+        emulator.reply = received
+
+    def report(self, written):
+        """Summarize the latencies of a series of changes.
+
+        Arguments
+        written (list): (sequence number, write time) of the changes
+
+        returns (dict): changes (number written), delivered (number that
+            reached the device), and per stage the percentiles (s) of the
+            time from the previous stage, and end_to_end from the write to
+            the device
+        """
+        times = dict(self.times, written=dict(written))
+        seqs = [seq for seq, _ in written]
+        stages = {}
+        for previous, stage in zip(STAGES, STAGES[1:]):
+            stages[stage] = percentiles(
+                [times[stage][s] - times[previous][s] for s in seqs
+                 if s in times[stage] and s in times[previous]])
+        stages["end_to_end"] = percentiles(
+            [times["device"][s] - times["written"][s] for s in seqs
+             if s in times["device"]])
+        return {"changes": len(seqs),
+                "delivered": sum(s in times["device"] for s in seqs),
+                "stages": stages}
+
+
+def run(rates, duration, settle, port, subscription, emulator_params):
+    """Change the controller node at increasing rates and follow each
+    change through the subscriber, run_command of project/ismatec_deltav,
+    the pump queue and the serial line to the emulated pump.
+
+    Arguments
+    rates (list): Node changes per second of each level
+    duration (float): Time (s) of each level
+    settle (float): Time (s) to wait for the pump after each level
+    port (int): TCP port of the controller server
+    subscription (dict): Monitoring settings of the node (see SUBSCRIPTION)
+    emulator_params (dict): Parameters of the emulator (see Emulator)
+
+    returns (list): Results of the levels
+    """
+    params = helper_functions.yaml_to_dict(
+        "tests/simulated_controller/parameter_file.yml")
+    params["endpoint"] = f"opc.tcp://127.0.0.1:{port}/instrument/"
+    conn, child = Pipe()
+    controller = Process(target=control, args=(params, child), daemon=True)
+    controller.start()
+    conn.recv()
+
+    stamps = Stamps()
+    emulator = IsmatecEmulator(**emulator_params)
+    stamps.wrap_device(emulator)
+    emulator.run()
+    pump = Ismatec(emulator.port)
+    pump.main()
+    stamps.wrap_pump(pump)
+    ismatec_deltav.ismatec = pump
+    sub = Subscriber.from_dictionary(
+        endpoint=params["endpoint"], uri=params["uri"],
+        object={"name": params["object"]["name"], "nodes": [NODE]},
+        subscription=subscription)
+    sub.set_callback(stamps.wrap_callback(ismatec_deltav.run_command))
+    stamps.wrap_subscriber(sub)
+    sub.run()
+    sleep(1.0)
+
+    results = []
+    seq = 1
+    for rate in rates:
+        conn.send((rate, duration, seq))
+        written = conn.recv()
+        seq = written[-1][0] + 1
+        sleep(settle)
+        result = dict(rate=rate, **stamps.report(written))
+        result["queue"] = pump._queue.stats()["high_water"]
+        print(json.dumps(result))
+        results.append(result)
+    conn.send(None)
+    controller.join()
+    emulator.stop()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Latency from a controller node change to the pump")
+    parser.add_argument(
+        "--rates",
+        help="Node changes per second of the levels",
+        type=float,
+        nargs="+",
+        default=[1, 5, 10, 20, 50, 100, 200]
+    )
+    parser.add_argument(
+        "--duration",
+        help="Time (s) of each level",
+        type=float,
+        default=5.0
+    )
+    parser.add_argument(
+        "--settle",
+        help="Time (s) to wait for the pump after each level",
+        type=float,
+        default=3.0
+    )
+    parser.add_argument(
+        "--publishing_interval",
+        help="Publishing interval (ms) of the subscription",
+        type=float,
+        default=100
+    )
+    parser.add_argument(
+        "--sampling_interval",
+        help="Sampling interval (ms) of the node, 0 for the fastest",
+        type=float,
+        default=0
+    )
+    parser.add_argument(
+        "--queue_size",
+        help="Queue size of the monitored item",
+        type=int,
+        default=100
+    )
+    parser.add_argument(
+        "--baudrate",
+        help="Baudrate of the emulated pump, 0 for no pacing",
+        type=int,
+        default=9600
+    )
+    parser.add_argument(
+        "--latency",
+        help="Time (s) the emulated pump takes to answer",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "--port",
+        help="TCP port of the controller server",
+        type=int,
+        default=4850
+    )
+    parser.add_argument(
+        "--output",
+        help="JSON file for the results",
+        type=str,
+        default=None
+    )
+    parser.add_argument(
+        "--debug_level",
+        help="debugger level (e.g. INFO, WARN, DEBUG, ...)",
+        type=str,
+        default="WARN"
+    )
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.debug_level)
+    subscription = {"publishing_interval": args.publishing_interval,
+                    "sampling_interval": args.sampling_interval,
+                    "queue_size": args.queue_size}
+    results = run(args.rates, args.duration, args.settle, args.port,
+                  subscription,
+                  {"baudrate": args.baudrate or None,
+                   "latency": args.latency})
+    if args.output:
+        with open(args.output, "wt") as file_obj:
+            json.dump(results, file_obj, indent=2, sort_keys=True)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare the CPU cost of updating tags on the OPC UA server backends.
+"""
+import argparse
+import json
+import logging
+from multiprocessing import Event, Process, Value
+from random import random
+from time import monotonic, process_time, sleep
+from opcua import Client
+from services.opc.server import OpcServer
+from services.opc.server_async import AsyncOpcServer
+
+__author__ = 'Brent Maranzano'
+__license__ = 'MIT'
+
+
+logger = logging.getLogger("instrument.benchmarks.opc_server")
+
+
+def make_parameters(endpoint, tags):
+    """Make the server parameters of a benchmark.
+
+    Arguments
+    endpoint (str): Server address
+    tags (int): Number of Float nodes
+
+    returns (dict): Server parameters (see OpcServer)
+    """
+    nodes = {f"TAG_{i}": {"type": "Float", "value": 0.0, "writable": False}
+             for i in range(tags)}
+    return {"endpoint": endpoint, "name": "Benchmark Server",
+            "uri": "http://benchmark.server",
+            "object": {"name": "object1", "nodes": nodes}}
+
+
+def subscribe(params, ready, stop, count, publishing_interval=100):
+    """Subscribe a client to all nodes, so updates are also encoded and
+    published. Runs in its own process to not load the measured one.
+
+    Arguments
+    params (dict): Server parameters
+    ready (Event): Set once the client subscribed
+    stop (Event): Set to disconnect the client
+    count (Value): Number of notifications received
+    publishing_interval (int): Publishing interval (ms)
+    """
+    class Counter(object):
+        def datachange_notification(self, node, val, data):
+            with count.get_lock():
+                count.value += 1
+
+    client = Client(params["endpoint"])
+    client.connect()
+    idx = client.get_namespace_index(params["uri"])
+    obj = client.get_objects_node().get_child(
+        f"{idx}:{params['object']['name']}")
+    nodes = [obj.get_child(f"{idx}:{name}")
+             for name in params["object"]["nodes"]]
+    sub = client.create_subscription(publishing_interval, Counter())
+    sub.subscribe_data_change(nodes)
+    ready.set()
+    stop.wait()
+    client.disconnect()
+
+
+def run_backend(backend, params, rate, duration, with_client):
+    """Update all nodes at a rate and measure the cost.
+
+    Arguments
+    backend (str): opcua_set_value (one set_value per node), opcua_batch
+        (OpcServer.set_values) or asyncua_batch (AsyncOpcServer.set_values)
+    params (dict): Server parameters
+    rate (float): Update cycles per second
+    duration (float): Time (s) to run
+    with_client (bool): Subscribe a client (in another process) to all
+        nodes
+
+    returns (dict): Results
+    """
+    cls = AsyncOpcServer if backend == "asyncua_batch" else OpcServer
+    server = cls(params)
+    server.run()
+    if with_client:
+        ready, stop, count = Event(), Event(), Value("i", 0)
+        client = Process(target=subscribe, args=(params, ready, stop, count))
+        client.start()
+        ready.wait()
+    nodes = server.get_nodes()
+    names = list(nodes)
+    cycles = []
+    cpu = process_time()
+    start = monotonic()
+    next_cycle = start
+    while monotonic() - start < duration:
+        values = {name: random() for name in names}
+        t = monotonic()
+        if backend == "opcua_set_value":
+            for name, value in values.items():
+                nodes[name].set_value(value)
+        else:
+            server.set_values(values)
+        cycles.append(monotonic() - t)
+        next_cycle += 1 / rate
+        sleep(max(0.0, next_cycle - monotonic()))
+    elapsed = monotonic() - start
+    cpu = process_time() - cpu
+    sleep(0.5)
+    notifications = None
+    if with_client:
+        notifications = count.value
+        stop.set()
+        client.join()
+    if backend == "asyncua_batch":
+        server.stop()
+    else:
+        server._server.stop()
+    cycles.sort()
+    return {
+        "backend": backend,
+        "tags": len(names),
+        "rate": rate,
+        "updates_per_s": len(cycles) * len(names) / elapsed,
+        "cpu_fraction": cpu / elapsed,
+        "cycle_p50": cycles[len(cycles) // 2],
+        "cycle_p99": cycles[int(len(cycles) * 0.99)],
+        "notifications": notifications
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the OPC UA server backends")
+    parser.add_argument(
+        "--tags",
+        help="Number of nodes updated each cycle",
+        type=int,
+        default=300
+    )
+    parser.add_argument(
+        "--rate",
+        help="Update cycles per second",
+        type=float,
+        default=1.0
+    )
+    parser.add_argument(
+        "--duration",
+        help="Time (s) each backend runs",
+        type=float,
+        default=10.0
+    )
+    parser.add_argument(
+        "--client",
+        help="Subscribe a client (in another process) to all nodes",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--backends",
+        help="Backends to compare",
+        nargs="+",
+        default=["opcua_set_value", "opcua_batch", "asyncua_batch"]
+    )
+    parser.add_argument(
+        "--port",
+        help="TCP port of the benchmark server",
+        type=int,
+        default=4841
+    )
+    parser.add_argument(
+        "--output",
+        help="JSON file for the results",
+        type=str,
+        default=None
+    )
+    parser.add_argument(
+        "--debug_level",
+        help="debugger level (e.g. INFO, WARN, DEBUG, ...)",
+        type=str,
+        default="WARN"
+    )
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.debug_level)
+    results = []
+    for i, backend in enumerate(args.backends):
+        params = make_parameters(
+            f"opc.tcp://127.0.0.1:{args.port + i}/benchmark/", args.tags)
+        result = run_backend(backend, params, args.rate, args.duration,
+                             args.client)
+        print(json.dumps(result))
+        results.append(result)
+    if args.output:
+        with open(args.output, "wt") as file_obj:
+            json.dump(results, file_obj, indent=2)
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure the throughput and latency of the Ismatec driver styles.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import threading
+from collections import Counter
+from time import monotonic, sleep
+from instruments.ismatec import ismatec, ismatec_asynchronous, \
+    ismatec_queue, ismatec_synchronous
+from tests.emulators.emulators import IsmatecEmulator
+
+__author__ = 'Brent Maranzano'
+__license__ = 'MIT'
+
+
+logger = logging.getLogger("instrument.benchmarks.serial")
+
+DRIVERS = {
+    "ismatec": ismatec.Ismatec,
+    "ismatec_queue": ismatec_queue.Ismatec,
+    "ismatec_synchronous": ismatec_synchronous.Ismatec,
+    "ismatec_asynchronous": ismatec_asynchronous.Ismatec
+}
+# fraction of the commands that are flowrate writes
+WORKLOADS = {"write": 1.0, "read": 0.0, "mixed": 0.5}
+
+
+def percentiles(values):
+    """Summarize a sample of times.
+
+    Arguments
+    values (list): Times (s)
+
+    returns (dict): p50, p99, p999, max and mean, None for no values
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    n = len(values)
+    return {"p50": values[n // 2], "p99": values[min(n - 1, int(n * 0.99))],
+            "p999": values[min(n - 1, int(n * 0.999))], "max": values[-1],
+            "mean": sum(values) / n}
+
+
+def run_threaded(driver, port, writes, concurrency, duration, warmup):
+    """Issue commands from client threads, each waiting for the result of
+    its command before the next one.
+
+    Arguments
+    driver (str): ismatec, ismatec_queue or ismatec_synchronous
+    port (str): Device port
+    writes (float): Fraction of flowrate writes, the others are reads
+    concurrency (int): Number of client threads
+    duration (float): Time (s) measured
+    warmup (float): Time (s) run before measuring
+
+    returns (dict): latencies, queue_waits (lists of times (s)), errors,
+        collapsed
+    """
+    pump = DRIVERS[driver](port)
+    waits = []
+    if driver == "ismatec_synchronous":
+        # the driver is not thread safe, the lock is its queue
+        lock = threading.Lock()
+
+        def call(method, *args):
+            queued = monotonic()
+            with lock:
+                waits.append(monotonic() - queued)
+                return method(*args)
+    else:
+        pump.main()
+        execute = pump._execute
+
+        def timed(request):
+            waits.append(monotonic() - request["queued"])
+            execute(request)
+        pump._execute = timed
+
+        def call(method, *args):
+            return method(*args).result()
+
+    latencies = []
+    errors = Counter()
+    start = monotonic() + warmup
+    end = start + duration
+
+    def client(seed):
+        rand = random.Random(seed)
+        while monotonic() < end:
+            t = monotonic()
+            try:
+                if rand.random() < writes:
+                    call(pump.set_flowrate, rand.randint(0, 999))
+                else:
+                    call(pump.get_flowrate)
+            except Exception as error:
+                errors[type(error).__name__] += 1
+            if t >= start:
+                latencies.append(monotonic() - t)
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True)
+               for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    sleep(warmup)
+    del waits[:]
+    for thread in threads:
+        thread.join()
+    if driver == "ismatec_synchronous":
+        pump._ser.close()
+    else:
+        pump.close()
+    return {"latencies": latencies, "queue_waits": waits,
+            "errors": dict(errors), "collapsed": getattr(pump, "_collapsed", 0)}
+
+
+async def _run_async(port, writes, concurrency, duration, warmup):
+    pump = DRIVERS["ismatec_asynchronous"](port)
+    await pump.connect()
+    latencies = []
+    errors = Counter()
+    start = monotonic() + warmup
+    end = start + duration
+
+    async def client(seed):
+        rand = random.Random(seed)
+        while monotonic() < end:
+            t = monotonic()
+            try:
+                if rand.random() < writes:
+                    await pump.set_flowrate(rand.randint(0, 999))
+                else:
+                    await pump.get_flowrate()
+            except Exception as error:
+                errors[type(error).__name__] += 1
+            if t >= start:
+                latencies.append(monotonic() - t)
+
+    await asyncio.gather(*[client(i) for i in range(concurrency)])
+    await pump.close()
+    # commands wait on the instrument lock, which is not instrumented
+    return {"latencies": latencies, "queue_waits": None,
+            "errors": dict(errors), "collapsed": 0}
+
+
+def run_driver(driver, workload, concurrency, duration, warmup,
+               emulator_params):
+    """Run a workload on a driver against a new emulated pump.
+
+    Arguments
+    driver (str): Driver style (see DRIVERS)
+    workload (str): write, read or mixed (see WORKLOADS)
+    concurrency (int): Number of concurrent clients
+    duration (float): Time (s) measured
+    warmup (float): Time (s) run before measuring
+    emulator_params (dict): Parameters of the emulator (see Emulator)
+
+    returns (dict): Results
+    """
+    emulator = IsmatecEmulator(seed=0, **emulator_params)
+    emulator.run()
+    writes = WORKLOADS[workload]
+    if driver == "ismatec_asynchronous":
+        run = asyncio.run(_run_async(emulator.port, writes, concurrency,
+                                     duration, warmup))
+    else:
+        run = run_threaded(driver, emulator.port, writes, concurrency,
+                           duration, warmup)
+    emulator.stop()
+    return {
+        "driver": driver,
+        "workload": workload,
+        "concurrency": concurrency,
+        "commands": len(run["latencies"]),
+        "commands_per_s": len(run["latencies"]) / duration,
+        "latency": percentiles(run["latencies"]),
+        "queue_wait": percentiles(run["queue_waits"] or []),
+        "errors": run["errors"],
+        "collapsed": run["collapsed"],
+        "device": emulator.stats,
+        # the synchronous driver does not read the replies, its latency is
+        # the time to hand the command to the port
+        "reads_replies": driver != "ismatec_synchronous"
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Find the runs slower than a baseline.
+
+    Arguments
+    results (list): Results of this run
+    baseline (list): Results of a previous run
+    tolerance (float): Allowed relative degradation (e.g. 0.2)
+
+    returns (list): Descriptions of the regressions
+    """
+    previous = {(r["driver"], r["workload"], r["concurrency"]): r
+                for r in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(
+            (result["driver"], result["workload"], result["concurrency"]))
+        if old is None:
+            continue
+        if result["commands_per_s"] < old["commands_per_s"] * (1 - tolerance):
+            regressions.append(
+                f"{result['driver']}/{result['workload']}: commands_per_s "
+                f"{old['commands_per_s']:.1f} -> "
+                f"{result['commands_per_s']:.1f}")
+        # no latency means no command of the run succeeded
+        if old["latency"] is None:
+            continue
+        if result["latency"] is None:
+            regressions.append(
+                f"{result['driver']}/{result['workload']}: latency p99 "
+                f"{old['latency']['p99']:.6f} -> no successful command")
+        elif result["latency"]["p99"] > \
+                old["latency"]["p99"] * (1 + tolerance):
+            regressions.append(
+                f"{result['driver']}/{result['workload']}: latency p99 "
+                f"{old['latency']['p99']:.6f} -> "
+                f"{result['latency']['p99']:.6f}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the Ismatec driver styles")
+    parser.add_argument(
+        "--drivers",
+        help="Driver styles to run",
+        nargs="+",
+        choices=list(DRIVERS),
+        default=list(DRIVERS)
+    )
+    parser.add_argument(
+        "--workloads",
+        help="Workloads to run",
+        nargs="+",
+        choices=list(WORKLOADS),
+        default=list(WORKLOADS)
+    )
+    parser.add_argument(
+        "--concurrency",
+        help="Number of concurrent clients",
+        type=int,
+        default=4
+    )
+    parser.add_argument(
+        "--duration",
+        help="Time (s) each run is measured",
+        type=float,
+        default=10.0
+    )
+    parser.add_argument(
+        "--warmup",
+        help="Time (s) each run is started before measuring",
+        type=float,
+        default=1.0
+    )
+    parser.add_argument(
+        "--baudrate",
+        help="Baudrate of the emulated pump, 0 for no pacing",
+        type=int,
+        default=9600
+    )
+    parser.add_argument(
+        "--latency",
+        help="Time (s) the emulated pump takes to answer",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "--jitter",
+        help="Maximum random time (s) added to the latency",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "--output",
+        help="JSON file for the results",
+        type=str,
+        default=None
+    )
+    parser.add_argument(
+        "--baseline",
+        help="JSON results of a previous run to compare with",
+        type=str,
+        default=None
+    )
+    parser.add_argument(
+        "--tolerance",
+        help="Relative degradation reported as a regression",
+        type=float,
+        default=0.2
+    )
+    parser.add_argument(
+        "--debug_level",
+        help="debugger level (e.g. INFO, WARN, DEBUG, ...)",
+        type=str,
+        default="WARN"
+    )
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.debug_level)
+    emulator_params = {"baudrate": args.baudrate or None,
+                       "latency": args.latency, "jitter": args.jitter}
+    results = []
+    for driver in args.drivers:
+        for workload in args.workloads:
+            result = run_driver(driver, workload, args.concurrency,
+                                args.duration, args.warmup, emulator_params)
+            print(json.dumps(result))
+            results.append(result)
+    if args.output:
+        with open(args.output, "wt") as file_obj:
+            json.dump(results, file_obj, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as file_obj:
+            regressions = compare(results, json.load(file_obj),
+                                  args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            raise SystemExit(1)
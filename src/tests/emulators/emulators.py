@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Emulate serial instruments on Linux pseudo-terminals for testing.
+"""
+import argparse
+import logging
+import os
+import random
+import select
+import threading
+import tty
+from time import monotonic, sleep
+
+__author__ = 'Brent Maranzano'
+__license__ = 'MIT'
+
+
+logger = logging.getLogger("instrument.emulators")
+
+
+class Emulator(object):
+    """Device answering a serial protocol on a pseudo-terminal. The drivers
+    open the terminal (port) like a serial port.
+
+    Commands are split at the protocol terminator and answered in order by
+    reply. The link can be impaired: a latency (plus a uniform random
+    jitter) before each reply, pacing of the received commands and sent
+    replies at the character time of a baudrate, and a probability to drop
+    each reply byte.
+    """
+
+    terminator = b"\r"  # end of a command frame
+
+    def __init__(self, latency=0.0, jitter=0.0, baudrate=None, drop=0.0,
+                 bits=10, link=None, seed=None):
+        """Create the emulator and its pseudo-terminal.
+
+        Arguments
+        latency (float): Time (s) the device takes to answer a command
+        jitter (float): Maximum random time (s) added to the latency
+        baudrate (int): Baudrate to pace the characters at, None for no
+            pacing
+        drop (float): Probability to drop a reply byte
+        bits (int): Bits per character (start, data, parity and stop bits)
+        link (str): Path of a symbolic link to the port (e.g. to reference
+            it in a parameter file)
+        seed (int): Seed of the jitter and drop random generator
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.drop = drop
+        self._char_time = bits / baudrate if baudrate else 0.0
+        self._random = random.Random(seed)
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        # a driver that does not read its replies must not stall the device
+        os.set_blocking(self._master, False)
+        self.port = os.ttyname(self._slave)
+        self._link = link
+        if link:
+            if os.path.lexists(link):
+                os.remove(link)
+            os.symlink(self.port, link)
+        self._running = False
+        self.stats = {"commands": 0, "replies": 0, "dropped": 0,
+                      "overrun": 0}
+
+    def reply(self, frame):
+        """Answer a command. Method to be overridden
+
+        Arguments
+        frame (bytes): Command without the terminator
+
+        returns (bytes): Reply, empty for no reply
+        """
+        raise NotImplementedError
+
+    def run(self):
+        """Serve the port in a background thread.
+        """
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        logger.info(f"{type(self).__name__} listening on {self.port}")
+
+    def stop(self):
+        """Stop serving and close the pseudo-terminal.
+        """
+        self._running = False
+        self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
+        if self._link and os.path.islink(self._link):
+            os.remove(self._link)
+
+    def _serve(self):
+        """Read the commands and write the replies.
+        """
+        buffer = b""
+        while self._running:
+            readable, _, _ = select.select([self._master], [], [], 0.1)
+            if not readable:
+                continue
+            try:
+                data = os.read(self._master, 4096)
+            except BlockingIOError:
+                continue
+            except OSError:
+                return
+            buffer += data
+            while self._running and self.terminator in buffer:
+                frame, buffer = buffer.split(self.terminator, 1)
+                # the command took its character time to arrive
+                sleep(self._char_time * (len(frame) + len(self.terminator)))
+                self.stats["commands"] += 1
+                try:
+                    reply = self.reply(frame)
+                except Exception:
+                    logger.exception(f"cannot answer {frame!r}")
+                    continue
+                if reply:
+                    sleep(self.latency + self._random.uniform(0, self.jitter))
+                    self._write(reply)
+
+    def _write(self, reply):
+        """Write a reply at the pace of the baudrate, dropping bytes.
+
+        Arguments
+        reply (bytes): Reply
+        """
+        if self.drop:
+            kept = bytes(b for b in reply if self._random.random() >= self.drop)
+            self.stats["dropped"] += len(reply) - len(kept)
+            reply = kept
+        self.stats["replies"] += 1
+        chunks = [reply[i:i + 1] for i in range(len(reply))] \
+            if self._char_time else [reply]
+        start = monotonic()
+        for i, chunk in enumerate(chunks):
+            wait = start + i * self._char_time - monotonic()
+            if wait > 0:
+                sleep(wait)
+            try:
+                os.write(self._master, chunk)
+            except BlockingIOError:
+                # the driver does not read, the bytes are lost
+                self.stats["overrun"] += len(chunk)
+            except OSError:
+                return
+
+
+class IsmatecEmulator(Emulator):
+    """Ismatec pumps (addresses 1-8) on one line. Commands are
+    "<address><command>" terminated by CR and acknowledged with "*", or "#"
+    if the command is unknown. "<address>S#####" sets the speed,
+    "<address>S" returns it followed by CR.
+    """
+
+    def __init__(self, **params):
+        """Create the emulator (see Emulator).
+        """
+        super().__init__(**params)
+        self.pumps = {str(a): {"running": False, "flowrate": 0, "mode": None}
+                      for a in range(1, 9)}
+
+    def reply(self, frame):
+        frame = frame.decode("ascii")
+        if frame[:1] == "@":
+            return b"*" if frame[1:] in self.pumps else b"#"
+        pump = self.pumps.get(frame[:1])
+        command = frame[1:]
+        if pump is None:
+            return b""
+        if command == "M":
+            pump["mode"] = "rpm"
+        elif command == "H":
+            pump["running"] = True
+        elif command == "I":
+            pump["running"] = False
+        elif command == "S":
+            return f"{pump['flowrate']:.1f}\r".encode("ascii")
+        elif command[:1] == "S" and command[1:].isdigit():
+            pump["flowrate"] = int(command[1:])
+        else:
+            return b"#"
+        return b"*"
+
+
+class IkaEmulator(Emulator):
+    """IKA overhead stirrer (NAMUR commands terminated by CR LF). IN_
+    commands are answered with "<value> <channel>" and CR LF, OUT_SP_4,
+    START_4 and STOP_4 are not answered. The speed present value follows
+    the set point while the stirrer runs.
+    """
+
+    terminator = b"\n"
+
+    def __init__(self, **params):
+        """Create the emulator (see Emulator).
+        """
+        super().__init__(**params)
+        self.running = False
+        self.rate_SP = 0.0
+
+    def reply(self, frame):
+        words = frame.decode("ascii").split()
+        if not words:
+            return b""
+        command = words[0]
+        if command == "IN_PV_4":
+            rate = self.rate_SP if self.running else 0.0
+            return f"{rate:.1f} 4\r\n".encode("ascii")
+        if command == "IN_SP_4":
+            return f"{self.rate_SP:.1f} 4\r\n".encode("ascii")
+        if command == "IN_NAME":
+            return b"Eurostar\r\n"
+        if command == "OUT_SP_4":
+            self.rate_SP = float(words[1])
+        elif command == "START_4":
+            self.running = True
+        elif command == "STOP_4":
+            self.running = False
+        return b""
+
+
+class BronkhorstEmulator(Emulator):
+    """Bronkhorst flow controller (ProPar ASCII messages ":<length><node>
+    <command>..." terminated by CR LF). Command 04 reads parameter 0x20
+    (measure) or 0x21 (setpoint) of process 1, command 01 writes the
+    setpoint and is answered with a status message. The measure follows the
+    setpoint.
+    """
+
+    terminator = b"\n"
+
+    def __init__(self, node=0x80, **params):
+        """Create the emulator (see Emulator).
+
+        Arguments
+        node (int): ProPar node address
+        """
+        super().__init__(**params)
+        self.node = node
+        self.setpoint = 0
+
+    def reply(self, frame):
+        frame = frame.decode("ascii").strip()
+        node, command = frame[3:5], frame[5:7]
+        if not frame.startswith(":") or int(node, 16) != self.node:
+            return b""
+        if command == "04":
+            parameter = int(frame[-2:], 16)
+            value = self.setpoint if parameter in (0x20, 0x21) else 0
+            return f":06{node}0201{frame[-2:]}{value:04X}\r\n".encode("ascii")
+        if command == "01":
+            self.setpoint = int(frame[-4:], 16)
+            status = "00"
+        else:
+            status = "03"
+        return f":04{node}00{status}{len(frame) // 2:02X}\r\n".encode("ascii")
+
+
+EMULATORS = {"ismatec": IsmatecEmulator, "ika": IkaEmulator,
+             "bronkhorst": BronkhorstEmulator}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="serial device emulator")
+    parser.add_argument(
+        "--device",
+        help="Device to emulate",
+        choices=sorted(EMULATORS),
+        default="ismatec"
+    )
+    parser.add_argument(
+        "--link",
+        help="Path of a symbolic link to the port",
+        type=str,
+        default=None
+    )
+    parser.add_argument(
+        "--latency",
+        help="Time (s) the device takes to answer a command",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "--jitter",
+        help="Maximum random time (s) added to the latency",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "--baudrate",
+        help="Baudrate to pace the characters at",
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        "--drop",
+        help="Probability to drop a reply byte",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "--debug_level",
+        help="debugger level (e.g. INFO, WARN, DEBUG, ...)",
+        type=str,
+        default="INFO"
+    )
+    args = parser.parse_args()
+    emulator = EMULATORS[args.device](
+        latency=args.latency, jitter=args.jitter, baudrate=args.baudrate,
+        drop=args.drop, link=args.link)
+    emulator.run()
+    print(emulator.port, flush=True)
+    threading.Event().wait()
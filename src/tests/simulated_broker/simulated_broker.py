@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Run a minimal MQTT broker for testing.
+"""
+import argparse
+import asyncio
+import logging
+import struct
+import threading
+
+__author__ = 'Brent Maranzano'
+__license__ = 'MIT'
+
+
+logger = logging.getLogger("instrument.simulated_broker")
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP, SUBSCRIBE, \
+    SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = range(1, 15)
+
+
+def topic_matches(pattern, topic):
+    """Check whether a topic matches a subscription filter.
+
+    Arguments
+    pattern (str): Filter with the wildcards + and #
+    topic (str): Topic
+
+    returns (bool): True if the topic matches
+    """
+    levels = topic.split("/")
+    for i, level in enumerate(pattern.split("/")):
+        if level == "#":
+            return True
+        if i >= len(levels) or (level != "+" and level != levels[i]):
+            return False
+    return len(levels) == len(pattern.split("/"))
+
+
+def _string(data, offset):
+    length = struct.unpack_from("!H", data, offset)[0]
+    return data[offset + 2:offset + 2 + length].decode("utf-8"), \
+        offset + 2 + length
+
+
+def _packet(kind, body, flags=0):
+    header = bytes([kind << 4 | flags])
+    length = len(body)
+    encoded = b""
+    while True:
+        byte = length % 128
+        length //= 128
+        encoded += bytes([byte | 0x80 if length else byte])
+        if not length:
+            return header + encoded + body
+
+
+class SimulatedBroker(object):
+    """MQTT 3.1.1 broker stand-in for tests. It supports connect, publish
+    (QoS 0, 1 and 2 inbound), retained messages, subscriptions with
+    wildcards, ping and disconnect. Messages are delivered to subscribers
+    with QoS 0. Sessions are not persisted.
+    """
+
+    def __init__(self, host="127.0.0.1", port=1883):
+        """Create the broker.
+
+        Arguments
+        host (str): Address to listen on
+        port (int): Port to listen on
+        """
+        self._host = host
+        self._port = port
+        self._subscriptions = dict()  # map between writer and filters
+        self.retained = dict()  # map between topic and payload
+        self.received = []  # list of (topic, payload, qos, retain)
+
+    def run(self):
+        """Start the broker in a background thread, returns once it is
+        listening.
+        """
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        self._server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._serve, self._host, self._port),
+            self._loop).result()
+        logger.info(f"MQTT broker listening on {self._host}:{self._port}")
+
+    def stop(self):
+        """Close the broker and all connections.
+        """
+        async def close():
+            self._server.close()
+            for writer in list(self._subscriptions):
+                writer.close()
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def _read_packet(self, reader):
+        """Read one control packet.
+
+        returns (tuple): (packet type, flags, body)
+        """
+        first = (await reader.readexactly(1))[0]
+        length, multiplier = 0, 1
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        body = await reader.readexactly(length) if length else b""
+        return first >> 4, first & 0x0F, body
+
+    async def _serve(self, reader, writer):
+        """Serve the packets of a client connection.
+        """
+        self._subscriptions[writer] = dict()
+        try:
+            while True:
+                kind, flags, body = await self._read_packet(reader)
+                if kind == CONNECT:
+                    writer.write(_packet(CONNACK, b"\x00\x00"))
+                elif kind == PUBLISH:
+                    self._publish(writer, flags, body)
+                elif kind == PUBREL:
+                    writer.write(_packet(PUBCOMP, body[:2]))
+                elif kind == SUBSCRIBE:
+                    self._subscribe(writer, body)
+                elif kind == UNSUBSCRIBE:
+                    offset = 2
+                    while offset < len(body):
+                        pattern, offset = _string(body, offset)
+                        self._subscriptions[writer].pop(pattern, None)
+                    writer.write(_packet(UNSUBACK, body[:2]))
+                elif kind == PINGREQ:
+                    writer.write(_packet(PINGRESP, b""))
+                elif kind == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._subscriptions.pop(writer, None)
+            writer.close()
+
+    def _publish(self, writer, flags, body):
+        """Handle a published message: acknowledge, retain and forward it.
+        """
+        qos, retain = (flags >> 1) & 0x03, flags & 0x01
+        topic, offset = _string(body, 0)
+        if qos:
+            packet_id, offset = body[offset:offset + 2], offset + 2
+            writer.write(_packet(PUBACK if qos == 1 else PUBREC, packet_id))
+        payload = body[offset:]
+        self.received.append((topic, payload, qos, bool(retain)))
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+        message = _packet(PUBLISH, body[:2 + len(topic.encode())] + payload)
+        for subscriber, patterns in self._subscriptions.items():
+            if any(topic_matches(p, topic) for p in patterns):
+                subscriber.write(message)
+
+    def _subscribe(self, writer, body):
+        """Handle a subscription: acknowledge it and send the matching
+        retained messages.
+        """
+        packet_id, offset, granted = body[:2], 2, b""
+        patterns = []
+        while offset < len(body):
+            pattern, offset = _string(body, offset)
+            offset += 1
+            self._subscriptions[writer][pattern] = 0
+            patterns.append(pattern)
+            granted += b"\x00"
+        writer.write(_packet(SUBACK, packet_id + granted))
+        for topic, payload in self.retained.items():
+            if any(topic_matches(p, topic) for p in patterns):
+                encoded = topic.encode()
+                writer.write(_packet(
+                    PUBLISH, struct.pack("!H", len(encoded)) + encoded +
+                    payload, flags=0x01))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="simulated MQTT broker")
+    parser.add_argument(
+        "--port",
+        help="Port to listen on",
+        type=int,
+        default=1883
+    )
+    parser.add_argument(
+        "--debug_level",
+        help="debugger level (e.g. INFO, WARN, DEBUG, ...)",
+        type=str,
+        default="INFO"
+    )
+    args = parser.parse_args()
+    broker = SimulatedBroker(port=args.port)
+    broker.run()
+    threading.Event().wait()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Run a loopback TCP device for testing socket attached instruments.
+"""
+import argparse
+import logging
+import socketserver
+import threading
+from time import sleep
+
+__author__ = 'Brent Maranzano'
+__license__ = 'MIT'
+
+
+logger = logging.getLogger("instrument.simulated_socket_device")
+
+
+class IsmatecPumps(object):
+    """Reply to Ismatec commands (address, command, CR) like pumps on a
+    serial device server: "*" acknowledges a command, "<address>S" returns
+    the set flowrate.
+    """
+
+    def __init__(self):
+        self.flowrates = dict()
+
+    def __call__(self, frame):
+        """Reply to a command frame.
+
+        Arguments
+        frame (bytes): Command without the CR
+
+        returns (bytes): Reply
+        """
+        if frame.startswith(b"@"):
+            return b"*"
+        address, body = frame[:1], frame[1:]
+        if body == b"S":
+            return f"{self.flowrates.get(address, 0):.1f}\r".encode()
+        if body.startswith(b"S"):
+            self.flowrates[address] = int(body[1:])
+        return b"*"
+
+
+class SimulatedSocketDevice(object):
+    """TCP server standing in for a LAN attached device. Commands are
+    framed by CR and answered in order by a handler, so pipelined commands
+    are served like on the device.
+    """
+
+    def __init__(self, host="127.0.0.1", port=5000, handler=None,
+                 latency=0.0):
+        """Create the device.
+
+        Arguments
+        host (str): Address to listen on
+        port (int): Port to listen on
+        handler (func): Function of a command frame returning the reply,
+            Ismatec pumps by default
+        latency (float): Time (s) the device takes per command
+        """
+        self.handler = handler or IsmatecPumps()
+        self.latency = latency
+        self.commands = []  # list of the received frames
+        self.connections = 0  # number of accepted connections
+        self._clients = []
+        device = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                device.connections += 1
+                device._clients.append(self.request)
+                buffer = b""
+                while True:
+                    try:
+                        data = self.request.recv(4096)
+                    except OSError:
+                        return
+                    if not data:
+                        return
+                    buffer += data
+                    while b"\r" in buffer:
+                        frame, buffer = buffer.split(b"\r", 1)
+                        device.commands.append(frame)
+                        sleep(device.latency)
+                        self.request.sendall(device.handler(frame))
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self._server.daemon_threads = True
+
+    def run(self):
+        """Serve in a background thread.
+        """
+        threading.Thread(target=self._server.serve_forever,
+                         daemon=True).start()
+        logger.info(f"device listening on {self._server.server_address}")
+
+    def drop_connections(self):
+        """Close the open connections (e.g. a network outage).
+        """
+        for client in self._clients:
+            try:
+                client.shutdown(2)
+                client.close()
+            except OSError:
+                pass
+        self._clients = []
+
+    def stop(self):
+        """Stop the server and close the connections.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        self.drop_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="simulated socket device")
+    parser.add_argument(
+        "--port",
+        help="Port to listen on",
+        type=int,
+        default=5000
+    )
+    parser.add_argument(
+        "--latency",
+        help="Time (s) the device takes per command",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "--debug_level",
+        help="debugger level (e.g. INFO, WARN, DEBUG, ...)",
+        type=str,
+        default="INFO"
+    )
+    args = parser.parse_args()
+    device = SimulatedSocketDevice(port=args.port, latency=args.latency)
+    device.run()
+    threading.Event().wait()
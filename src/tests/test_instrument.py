@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the collapsing of identical reads by Instrument.
+"""
+import threading
+from instruments.instrument import Instrument
+
+__author__ = "Brent Maranzano"
+__license__ = "MIT"
+
+
+class Device(Instrument):
+    """Instrument holding one value, its transactions are counted and can be
+    held in flight.
+    """
+
+    _readables = {"x": {"command": "read"}}
+
+    def __init__(self):
+        super().__init__("none")
+        self.value = 0
+        self.reads = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def _process_request(self, command=None, value=None, **kwargs):
+        self.started.set()
+        self.release.wait()
+        if command == "write":
+            self.value = value
+            return True
+        self.reads += 1
+        return self.value
+
+    def write(self, value):
+        return self._queue_request(command="write", value=value,
+                                   coalesce="x")
+
+    def serve(self):
+        while self._queue.qsize():
+            self._execute(self._queue.get())
+
+
+def start_read(device):
+    """Start serving a queued read and hold it in flight.
+
+    returns (Thread): thread serving the read
+    """
+    device.release.clear()
+    thread = threading.Thread(target=device._execute,
+                              args=(device._queue.get(),))
+    thread.start()
+    device.started.wait()
+    return thread
+
+
+def test_queued_reads_collapse():
+    device = Device()
+    futures = [device._read("x") for _ in range(3)]
+    device.serve()
+    assert device.reads == 1
+    assert [f.result(timeout=0) for f in futures] == [0, 0, 0]
+
+
+def test_read_attaches_to_read_in_flight():
+    device = Device()
+    first = device._read("x")
+    thread = start_read(device)
+    second = device._read("x")
+    assert device._queue.qsize() == 0
+    device.release.set()
+    thread.join()
+    assert (first.result(timeout=0), second.result(timeout=0)) == (0, 0)
+    assert device.reads == 1
+    assert device.queue_stats()["collapsed"] == 1
+
+
+def test_read_after_write_does_not_attach():
+    device = Device()
+    first = device._read("x")
+    thread = start_read(device)
+    device.write(5)
+    second = device._read("x")
+    device.release.set()
+    thread.join()
+    device.serve()
+    assert (first.result(timeout=0), second.result(timeout=0)) == (0, 5)
+    assert device.reads == 2
+
+
+def test_write_being_queued_is_a_barrier():
+    device = Device()
+    put = device._queue.put
+    queuing = threading.Event()
+
+    def put_after_read_started(request, *args, **kwargs):
+        if request["command"] == "write":
+            queuing.set()
+            device.started.wait()
+        return put(request, *args, **kwargs)
+    device._queue.put = put_after_read_started
+    first = device._read("x")
+    writer = threading.Thread(target=device.write, args=(5,))
+    writer.start()
+    queuing.wait()
+    thread = start_read(device)
+    writer.join()
+    second = device._read("x")
+    device.release.set()
+    thread.join()
+    device.serve()
+    assert (first.result(timeout=0), second.result(timeout=0)) == (0, 5)
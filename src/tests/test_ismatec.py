@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the queued Ismatec driver against the pty emulator.
+"""
+from concurrent.futures import CancelledError
+import pytest
+from instruments.ismatec.ismatec import Ismatec
+from tests.emulators.emulators import IsmatecEmulator
+
+__author__ = "Brent Maranzano"
+__license__ = "MIT"
+
+
+@pytest.fixture
+def emulator():
+    emulator = IsmatecEmulator(latency=0.01)
+    emulator.run()
+    yield emulator
+    emulator.stop()
+
+
+def test_stop_cancels_pending_start(emulator):
+    pump = Ismatec(emulator.port)
+    pump.connect()
+    # queue before the worker starts, so start is pending when stop arrives
+    read = pump.get_flowrate()
+    write = pump.set_flowrate(100)
+    start = pump.start()
+    stop = pump.stop()
+    pump._start_threads()
+    assert stop.result(timeout=2)
+    assert read.result(timeout=2) == 0.0
+    for future in (write, start):
+        with pytest.raises(CancelledError):
+            future.result(timeout=2)
+    assert not emulator.pumps["1"]["running"]
+    assert pump.queue_stats()["superseded"] == 2
+
+
+def test_start_stop_ends_stopped(emulator):
+    pump = Ismatec(emulator.port)
+    pump.main()
+    for _ in range(20):
+        pump.get_flowrate()
+        pump.set_flowrate(100)
+        pump.start()
+        stop = pump.stop()
+        assert stop.result(timeout=2)
+        assert not emulator.pumps["1"]["running"]
+
+
+def test_start_after_stop_is_served(emulator):
+    pump = Ismatec(emulator.port)
+    pump.main()
+    pump.stop()
+    assert pump.start().result(timeout=2)
+    assert emulator.pumps["1"]["running"]
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the instrument request queue.
+"""
+import queue
+from concurrent.futures import CancelledError, Future
+import pytest
+from instruments.request_queue import (BACKGROUND, CRITICAL, NORMAL,
+                                       RequestQueue)
+
+__author__ = "Brent Maranzano"
+__license__ = "MIT"
+
+
+def request(command, **params):
+    return dict(command=command, future=Future(), **params)
+
+
+def drain(requests):
+    commands = []
+    while requests.qsize():
+        commands.append(requests.get_nowait()["command"])
+    return commands
+
+
+def test_lanes_are_served_by_priority_then_fifo():
+    requests = RequestQueue()
+    requests.put(request("poll", cache="x", priority=BACKGROUND))
+    requests.put(request("a"))
+    requests.put(request("b", priority=NORMAL))
+    requests.put(request("read", cache="y", priority=CRITICAL))
+    assert drain(requests) == ["read", "a", "b", "poll"]
+    assert requests.stats()["critical_wait"]["count"] == 1
+
+
+def test_critical_command_supersedes_pending_commands():
+    requests = RequestQueue()
+    read = request("get", cache="x")
+    write = request("set", coalesce="x")
+    start = request("start")
+    poll = request("poll", cache="y", priority=BACKGROUND)
+    for item in (read, write, start, poll):
+        requests.put(item)
+    requests.put(request("stop", priority=CRITICAL))
+    assert drain(requests) == ["stop", "get", "poll"]
+    for item in (write, start):
+        with pytest.raises(CancelledError):
+            item["future"].result(timeout=0)
+    assert requests.stats()["superseded"] == 2
+
+
+def test_coalesce_replaces_pending_write():
+    requests = RequestQueue(coalesce=True)
+    first = request("set", coalesce="x", value=1)
+    requests.put(first)
+    requests.put(request("set", coalesce="x", value=2))
+    assert requests.qsize() == 1
+    merged = requests.get_nowait()
+    assert merged["value"] == 2
+    assert [f for f, _ in merged["followers"]] == [first["future"]]
+    assert requests.stats()["coalesced"] == 1
+
+
+def test_coalesce_stops_at_ordered_command():
+    requests = RequestQueue(coalesce=True)
+    requests.put(request("set", coalesce="x", value=1))
+    requests.put(request("start"))
+    requests.put(request("set", coalesce="x", value=2))
+    assert drain(requests) == ["set", "start", "set"]
+
+
+def test_coalesce_disabled_keeps_writes():
+    requests = RequestQueue()
+    requests.put(request("set", coalesce="x", value=1))
+    requests.put(request("set", coalesce="x", value=2))
+    assert requests.qsize() == 2
+
+
+def test_identical_reads_collapse():
+    requests = RequestQueue()
+    first = request("get", cache="x")
+    requests.put(first)
+    second = request("get", cache="x")
+    requests.put(second)
+    assert requests.qsize() == 1
+    assert first["followers"][0][0] is second["future"]
+    assert requests.stats()["collapsed"] == 1
+
+
+def test_reads_do_not_collapse_across_write():
+    requests = RequestQueue()
+    requests.put(request("get", cache="x"))
+    requests.put(request("set", coalesce="x"))
+    requests.put(request("get", cache="x"))
+    requests.put(request("get", cache="y"))
+    assert drain(requests) == ["get", "set", "get", "get"]
+
+
+def test_overflow_reject():
+    requests = RequestQueue(maxsize=1, overflow="reject")
+    requests.put(request("a"))
+    with pytest.raises(queue.Full):
+        requests.put(request("b"))
+    assert requests.stats()["rejected"] == 1
+
+
+def test_overflow_block_times_out():
+    requests = RequestQueue(maxsize=1)
+    requests.put(request("a"))
+    with pytest.raises(queue.Full):
+        requests.put(request("b"), timeout=0.05)
+
+
+def test_overflow_drop_oldest_evicts_least_critical_lane():
+    requests = RequestQueue(maxsize=2, overflow="drop_oldest")
+    poll = request("poll", cache="x", priority=BACKGROUND)
+    requests.put(request("a"))
+    requests.put(poll)
+    requests.put(request("b"))
+    with pytest.raises(queue.Full):
+        poll["future"].result(timeout=0)
+    assert drain(requests) == ["a", "b"]
+    assert requests.stats()["dropped"] == 1
+
+
+def test_overflow_accepts_critical_and_replacing_requests():
+    requests = RequestQueue(maxsize=1, coalesce=True, overflow="reject")
+    requests.put(request("set", coalesce="x", value=1))
+    requests.put(request("set", coalesce="x", value=2))
+    requests.put(request("read", cache="y", priority=CRITICAL))
+    assert requests.qsize() == 2
+
+
+def test_unknown_overflow_policy():
+    with pytest.raises(ValueError):
+        RequestQueue(overflow="grow")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the subscriber node names and batched writes against a local
+OPC UA server.
+"""
+import pytest
+from opcua import Server
+from services.opc.subscriber import Subscriber
+
+__author__ = "Brent Maranzano"
+__license__ = "MIT"
+
+
+ENDPOINT = "opc.tcp://127.0.0.1:48611/test/"
+
+
+@pytest.fixture(scope="module")
+def variables():
+    """Server with a short name shared by two objects and an object name
+    shared by two namespaces.
+
+    returns (dict): Keys are (uri, object, name), values are variable Nodes
+    """
+    server = Server()
+    server.set_endpoint(ENDPOINT)
+    variables = dict()
+    for uri, obj, names in [("http://a", "obj1", ["A", "B"]),
+                            ("http://a", "obj2", ["B"]),
+                            ("http://b", "obj2", ["B"]),
+                            ("http://a", "obj3", [f"N{i}" for i in range(20)])]:
+        idx = server.register_namespace(uri)
+        node = server.nodes.objects.add_object(idx, obj)
+        for name in names:
+            variables[(uri, obj, name)] = node.add_variable(idx, name, 0.0)
+            variables[(uri, obj, name)].set_writable()
+    server.start()
+    yield variables
+    server.stop()
+
+
+@pytest.fixture
+def subscriber(variables):
+    sub = Subscriber.from_dictionary(
+        endpoint=ENDPOINT, uri="http://a",
+        objects=[{"name": "obj1", "nodes": ["A", "B"]},
+                 {"name": "obj2", "nodes": ["B"]},
+                 {"name": "obj2", "uri": "http://b", "nodes": ["B"]},
+                 {"name": "obj3", "nodes": [f"N{i}" for i in range(20)]}])
+    sub.set_callback(lambda name, value: None)
+    sub.run()
+    yield sub
+    sub._client.disconnect()
+
+
+def test_names_are_qualified_only_when_ambiguous(subscriber):
+    assert subscriber.canonical_name("A") == "A"
+    assert subscriber.canonical_name("http://a/obj1/A") == "A"
+    assert subscriber.canonical_name("obj1/B") == "obj1/B"
+    assert subscriber.canonical_name("http://a/obj2/B") == "http://a/obj2/B"
+    assert subscriber.canonical_name("http://b/obj2/B") == "http://b/obj2/B"
+    with pytest.raises(KeyError):
+        subscriber.canonical_name("B")
+    with pytest.raises(KeyError):
+        subscriber.canonical_name("obj2/B")
+
+
+def test_respond_writes_the_named_node(subscriber, variables):
+    subscriber.respond("obj1/B", 5.0)
+    subscriber.respond("http://b/obj2/B", 7.0)
+    assert variables[("http://a", "obj1", "B")].get_value() == 5.0
+    assert variables[("http://b", "obj2", "B")].get_value() == 7.0
+    assert variables[("http://a", "obj2", "B")].get_value() == 0.0
+
+
+def test_respond_many_writes_in_one_call(subscriber, variables):
+    write = subscriber._client.uaclient.write
+    calls = []
+
+    def counted(params):
+        calls.append(len(params.NodesToWrite))
+        return write(params)
+    subscriber._client.uaclient.write = counted
+    results = subscriber.respond_many({f"N{i}": i * 2.0 for i in range(20)})
+    assert calls == [20]
+    assert all(status.is_good() for status in results.values())
+    assert variables[("http://a", "obj3", "N3")].get_value() == 6.0